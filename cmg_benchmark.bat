@@ -0,0 +1,7 @@
+@echo off
+rem Run cmg_benchmark on Windows
+
+rem python.exe should be on the PATH
+rem %~dp0 is the directory of this script
+
+python.exe "%~dp0cmg_benchmark" %*
@@ -0,0 +1,111 @@
+"""registry of backends, the modules which handle components of each type
+(the `type' option in stream/baseline configuration).
+
+A backend module provides, for a component:
+    download(root, config, component)
+    status(root, config, component), which returns a list of states
+    upload(root, config, component)
+    freeze(root, config_now, config_ref, component, baseline, new_tags)
+and optionally:
+    download_fetch(root, config, component) and download_apply(root, config,
+        component), two stages instead of download(), see run_pipeline() in
+        common.py
+    get_host_url(config, component), the url whose server's slot download()
+        holds, see get_host_slot() in common.py
+    find_unchanged(root, config_ref, components), see freeze in commands.py
+    prepare_status(root, config, components), to find out in advance for all
+        components what status() needs, see status in commands.py
+See git.py, svn.py and file.py.
+
+A backend module is imported only when a component of its type shows up.
+Another package could provide a backend via an entry point in group
+'cmglib.backends', named after the type, such as:
+    iver = iverglue.backend
+or call register() before CMG runs a command.
+"""
+
+import sys
+import importlib
+
+ENTRY_POINT_GROUP = "cmglib.backends"
+
+#module name of the backend of each type, see register()
+BACKENDS = {'git': "cmglib.git", \
+    'svn': "cmglib.svn", \
+    'subversion': "cmglib.svn", \
+    'fl': "cmglib.file", \
+    'file': "cmglib.file", \
+    'dir': "cmglib.file", \
+    'directory': "cmglib.file"}
+
+_backends = {} #imported backend module of each type. See load().
+
+def register(type, module):
+    """Register `module' (a module, or the name of a module to import when
+    needed) as the backend of components of `type'."""
+
+    type = type.lower()
+    _backends.pop(type, None)
+    if isinstance(module, str):
+        BACKENDS[type] = module
+    else:
+        BACKENDS[type] = module.__name__
+        _backends[type] = module
+
+def find_entry_point(type):
+    """Find the entry point of a backend for `type' provided by another
+    package. Return None if not found."""
+
+    try:
+        from importlib import metadata
+    except ImportError: #Python 3.7 or before
+        return None
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        entry_points = entry_points.select(group=ENTRY_POINT_GROUP)
+    else: #Python 3.9 or before
+        entry_points = entry_points.get(ENTRY_POINT_GROUP, [])
+    for entry_point in entry_points:
+        if entry_point.name.lower() == type:
+            return entry_point
+    return None
+
+def load(type):
+    """Get the backend module of components of `type', import it if not yet.
+    Return None if no backend supports `type'."""
+
+    type = type.lower()
+    if type in _backends:
+        return _backends[type]
+
+    try:
+        if type in BACKENDS:
+            module = importlib.import_module(BACKENDS[type])
+        else:
+            entry_point = find_entry_point(type)
+            if entry_point == None:
+                return None
+            module = entry_point.load()
+    except ImportError as err:
+        sys.stderr.write("Failed: can not load the backend of type '" + type + "':\n" + str(err))
+        sys.exit(2)
+
+    _backends[type] = module
+    return module
+
+def get_backend(config, component):
+    """Get the backend module of `component' in stream/baseline `config'."""
+
+    if not config.has_option(component, 'type'):
+        sys.stderr.write("Failed: bad format of stream/baseline config: ")
+        sys.stderr.write("No 'type' option in '" + component + "' section.")
+        sys.exit(2)
+
+    type = config.get(component, 'type')
+    backend = load(type)
+    if backend == None:
+        sys.stderr.write("Failed: bad format of stream/baseline config: ")
+        sys.stderr.write("type '" + type + "' is not supported.")
+        sys.exit(2)
+    return backend
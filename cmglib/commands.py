@@ -3,17 +3,118 @@ import sys
 
 from cmglib import common
 from cmglib import git
-from cmglib import svn
-from cmglib import file
+from cmglib import backends
+
+POLICY_OPTIONS = {'--dirty': 'dirty', '--conflict': 'conflict', '--freeze-point': 'freezepoint'}
+"""Command line options which set a CMG configuration in common.POLICIES."""
+
+def parse_args(args, usage, options):
+    """Parse command line paramaters of a command.
+    
+    `usage' shows help of the command. `options' lists the options (such as
+    '-j', '--refresh', '--non-interactive' and those in POLICY_OPTIONS) the
+    command accepts besides -h/--help. Return the other paramaters,
+    as well as a dict of CMG configurations given by options, which should
+    overwrite those in common.cfgs after get_cmg_cfg().
+    """
+
+    rest = []
+    cfgs = {}
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in ('-h', "--help"):
+            usage()
+            sys.exit()
+        elif '-j' in options and arg in ('-j', "--jobs"):
+            i = i + 1
+            cfgs['jobs'] = parse_number(args[i:i+1], usage)
+        elif '-j' in options and arg[:7] == "--jobs=":
+            cfgs['jobs'] = parse_number([arg[7:]], usage)
+        elif '-j' in options and arg[:2] == '-j':
+            cfgs['jobs'] = parse_number([arg[2:]], usage)
+        elif '--refresh' in options and arg == "--refresh":
+            cfgs['fetchttl'] = 0
+            cfgs['svntipttl'] = 0
+        elif '--non-interactive' in options and arg == "--non-interactive":
+            cfgs['interactive'] = False
+        elif arg.split("=")[0] in options and arg.split("=")[0] in POLICY_OPTIONS:
+            key = POLICY_OPTIONS[arg.split("=")[0]]
+            if "=" in arg:
+                value = arg.split("=", 1)[1]
+            elif i + 1 < len(args):
+                i = i + 1
+                value = args[i]
+            else:
+                value = ""
+            if value not in common.POLICIES[key]:
+                sys.stderr.write("Failed: wrong format of command line paramaters: " + arg.split("=")[0] + \
+                    " should be " + "|".join(common.POLICIES[key]) + ".")
+                usage()
+                sys.exit(2)
+            cfgs[key] = value
+        elif arg[0] == '-':
+            sys.stderr.write("Failed: wrong format of command line paramaters.")
+            usage()
+            sys.exit(2)
+        else:
+            rest.append(arg)
+        i = i + 1
+
+    return (rest, cfgs)
+
+def parse_number(values, usage):
+    """Get the positive number of an option, from a list of no or one value."""
+
+    if len(values) == 1 and values[0].isdigit() and int(values[0]) > 0:
+        return int(values[0])
+
+    sys.stderr.write("Failed: wrong format of command line paramaters: a positive number is expected.")
+    usage()
+    sys.exit(2)
+
+def get_waves(components):
+    """Split components into waves, so that when handle each wave in parallel,
+    a component which lies in another component's directory is handled after
+    that component."""
+
+    waves = []
+    for component in components:
+        depth = len(common.get_parents(component, components))
+        while len(waves) <= depth:
+            waves.append([])
+        waves[depth].append(component)
+    return waves
+
+def report_failures(failures, action):
+    """Report components that failed in parallel, and exit if any."""
+
+    if len(failures) == 0:
+        return
+
+    sys.stderr.write("Failed to " + action + " " + str(len(failures)) + " component(s):\n")
+    for (component, code) in failures:
+        sys.stderr.write("    " + component + "\n")
+    sys.exit(2)
 
 def download_usage():
     print("""
 Download/sync/update from remote repositories/places to local.
 
-Usage: cmg download [-h|--help] [<tag>|<remote-tracking branch>|<local branch>]
+Usage: cmg download [-h|--help] [-j <n>] [--refresh] [--non-interactive]
+                    [--dirty <policy>] [--conflict <policy>]
+                    [<tag>|<remote-tracking branch>|<local branch>]
 
     (no paramater)      download current stream
     -h, --help          help
+    -j, --jobs <n>      download <n> components at the same time
+    --refresh           fetch even if fetched within cmg.fetchttl seconds
+    --non-interactive   never ask, fail instead if a question is not answered
+                        by an option below
+    --dirty abort|stash|reset|commit
+                        what to do with local modifications in a working tree
+    --conflict abort|skip
+                        what to do if rebase/merge has conflicts
     <tag>               tag name that indicate the baseline
     <remote-tracking branch>
                         remote-tracking branch name (such as origin/master)
@@ -26,24 +127,20 @@ def download(args):
     """Download/sync/update from remote repositories/places to local repositories / working trees."""
 
     point = ""
+    (args, cfgs) = parse_args(args, download_usage, \
+        ('-j', '--refresh', '--non-interactive', '--dirty', '--conflict'))
     if len(args) == 0:
         pass
     elif len(args) > 1:
         sys.stderr.write("Failed: wrong format of command line paramaters.")
         download_usage()
         sys.exit(2)
-    elif args[0] in ('-h', "--help"):
-        download_usage()
-        sys.exit()
-    elif args[0][0] == '-':
-        sys.stderr.write("Failed: wrong format of command line paramaters.")
-        download_usage()
-        sys.exit(2)
     else:
         point = args[0]
 
     root = common.get_root()
     git.get_cmg_cfg(root)
+    common.cfgs.update(cfgs)
     print("---- " + root)
     
     if common.cfgs['online']:
@@ -98,36 +195,56 @@ def download(args):
     else:
         tag_annotation = git.get_tag_annotation(root, tag)
         config = common.get_baseline_cfg(root, tag, tag_annotation)
-        
+
+    if common.cfgs['jobs'] > 1:
+        tasks = []
+        for wave in get_waves(config.sections()):
+            for component in wave:
+                (fetch, apply) = get_download_stages(root, config, component)
+                tasks.append((component, fetch, apply, common.get_parents(component, config.sections())))
+        report_failures(common.run_pipeline(tasks, common.cfgs['jobs']), "download")
+        return
+
     for component in config.sections():
-        if not config.has_option(component, 'type'):
-            sys.stderr.write("Failed: bad format of stream/baseline config: ")
-            sys.stderr.write("No 'type' option in '" + component + "' section.")
-            sys.exit(2)
-        
-        type = config.get(component, 'type')
-        if type.lower() == 'git':
-            git.download(root, config, component)
-        elif type.lower() == 'svn' or type.lower() == 'subversion':
-            svn.download(root, config, component)
-        elif type.lower() == 'fl' or type.lower() == 'file':
-            file.download(root, config, component, True)
-        elif type.lower() == 'dir' or type.lower() == 'directory':
-            file.download(root, config, component, False)
-        else:
-            sys.stderr.write("Failed: bad format of stream/baseline config: ")
-            sys.stderr.write("type '" + type + "' is not supported.")
-            sys.exit(2)
+        download_component(root, config, component)
+
+def get_download_stages(root, config, component):
+    """Get (fetch, apply) stages to download a component in a pipeline, see
+    run_pipeline() in common.py. A component whose backend has no fetch stage
+    (such as SVN) is fetched and updated in one go, so it's all done in the
+    local stage, see download_component()."""
+
+    backend = backends.get_backend(config, component)
+    if hasattr(backend, 'download_fetch'):
+        return ((backend.download_fetch, (root, config, component)), \
+            (backend.download_apply, (root, config, component)))
+    return (None, (download_component, (root, config, component)))
+
+def download_component(root, config, component):
+    """Download/sync/update a component according to its type. If the backend
+    tells the url of its server, it holds a slot of the server."""
+
+    common.set_component(component)
+    backend = backends.get_backend(config, component)
+    if hasattr(backend, 'get_host_url'):
+        with common.get_host_slot(backend.get_host_url(config, component)):
+            backend.download(root, config, component)
+    else:
+        backend.download(root, config, component)
 
             
 def status_usage():
     print("""
 Show status/diff information of container and each component
 
-Usage: cmg status [-h|--help] [<tag>|<remote-tracking branch>|<local branch>]
+Usage: cmg status [-h|--help] [-j <n>] [--refresh] [--non-interactive]
+                  [<tag>|<remote-tracking branch>|<local branch>]
 
     (no paramater)      show status of current stream
     -h, --help          help
+    -j, --jobs <n>      check <n> components at the same time
+    --refresh           fetch even if fetched within cmg.fetchttl seconds
+    --non-interactive   never ask, fail instead
     <tag>               see if current workspace match the baseline
     <remote-tracking branch>
                         remote-tracking branch name (such as origin/master)
@@ -140,24 +257,19 @@ def status(args):
     """Show status/diff information of container and each component"""
 
     point = ""
+    (args, cfgs) = parse_args(args, status_usage, ('-j', '--refresh', '--non-interactive'))
     if len(args) == 0:
         pass
     elif len(args) > 1:
         sys.stderr.write("Failed: wrong format of command line paramaters.")
         status_usage()
         sys.exit(2)
-    elif args[0] in ('-h', "--help"):
-        status_usage()
-        sys.exit()
-    elif args[0][0] == '-':
-        sys.stderr.write("Failed: wrong format of command line paramaters.")
-        status_usage()
-        sys.exit(2)
     else:
         point = args[0]
         
     root = common.get_root()
     git.get_cmg_cfg(root)
+    common.cfgs.update(cfgs)
     print("---- " + root)
     
     if common.cfgs['online']:
@@ -165,12 +277,14 @@ def status(args):
     else:
         print("Warning: CMG is running under offline mode. No interaction with remote.")
     
+    state = []
     local = remote = tag = ""
     if point == "":
         (local, remote) = git.get_current_br_pair(root)
         if local == "":
             print("Warning: it's expected to be on a local branch "\
                 + "that follow a remote-tracking branch, but currently not.")
+            state.append("off-branch")
     else:
         if git.is_local_br(root, point):
             local = point
@@ -178,6 +292,7 @@ def status(args):
             if remote == "":
                 print("Warning: can not find local branch "\
                     + local + "'s remote-tracking branch.\n")
+                state.append("off-branch")
         elif git.is_local_br_to_create(root, point):
             local = git.create_default_local_br(root, point)
             remote = "origin/" + local
@@ -191,6 +306,7 @@ def status(args):
         else:
             print("Warning: '" + point + "' is not a local branch, or "\
                 + "remote-tracking branch, or tag.")
+            state.append("off-branch")
 
     if local != "" and remote != "" and point != "": #to check if current branch is the given branch
         (local_now, remote_now) = git.get_current_br_pair(root)
@@ -199,21 +315,25 @@ def status(args):
                 + local + "' to follow remote-tracking branch '" + remote +"', "\
                 + "but currently it's not on a local branch " \
                 + "that follow a remote-tracking branch.")
+            state.append("off-branch")
         elif local_now != local:
             print("Warning: it's expected to be on local branch '"\
                 + local + "' to follow remote-tracking branch '" + remote +"', "\
                 + "but currently it's on local branch '" + local_now\
                 + "' that follow remote-tracking branch '" + remote_now + "'.")
+            state.append("off-branch")
         
     elif tag != "": # to check if HEAD is on the given tag
         if not git.is_on_tag(root, tag):
             print("Warning: it's expected to be on tag '" + tag\
                 + "', but currently it's not.")
+            state.append("off-branch")
 
     if local != "" and remote != "": #to check if remote-tracking branch has multiple local branch
         git.remind_multi_local(root, remote)
         
-    git.get_status(root)
+    states = {}
+    states["."] = state + git.get_status(root)
             
     config = None
     if tag == "":
@@ -221,35 +341,73 @@ def status(args):
     else:
         tag_annotation = git.get_tag_annotation(root, tag)
         config = common.get_baseline_cfg(root, tag, tag_annotation)
-        
-    for component in config.sections():
-        if not config.has_option(component, 'type'):
-            sys.stderr.write("Failed: bad format of stream/baseline config: ")
-            sys.stderr.write("No 'type' option in '" + component + "' section.")
-            sys.exit(2)
-        
-        type = config.get(component, 'type')
-        if type.lower() == 'git':
-            git.status(root, config, component)
-        elif type.lower() == 'svn' or type.lower() == 'subversion':
-            svn.status(root, config, component)
-        elif type.lower() == 'fl' or type.lower() == 'file':
-            file.status(root, config, component)
-        elif type.lower() == 'dir' or type.lower() == 'directory':
-            file.status(root, config, component)
+
+    for (backend, components) in group_by_backend(config, config.sections()).items():
+        if hasattr(backend, 'prepare_status'):
+            backend.prepare_status(root, config, components)
+
+    failures = []
+    if common.cfgs['jobs'] > 1:
+        tasks = []
+        for component in config.sections():
+            tasks.append((component, status_component, (root, config, component, states)))
+        failures = common.run_parallel(tasks, common.cfgs['jobs'], True)
+    else:
+        for component in config.sections():
+            status_component(root, config, component, states)
+
+    print_summary(["."] + config.sections(), states)
+    report_failures(failures, "check status of")
+
+def group_by_backend(config, components):
+    """Get a dict of components of each backend. Components with no or a bad
+    type are left out, to fail later on their own."""
+
+    groups = {}
+    for component in components:
+        if config.has_option(component, 'type'):
+            backend = backends.load(config.get(component, 'type'))
+            if backend != None:
+                groups.setdefault(backend, []).append(component)
+    return groups
+
+def status_component(root, config, component, states):
+    """Show status of a component according to its type, and put what found
+    out into dict `states'."""
+
+    common.set_component(component)
+    states[component] = backends.get_backend(config, component).status(root, config, component)
+
+def print_summary(components, states):
+    """Show a table of what found out for the container (named '.') and each component."""
+
+    width = max([len("component")] + [len(component) for component in components])
+    print("---- summary")
+    print("component".ljust(width) + "  state")
+    for component in components:
+        if component not in states:
+            state = "unknown (failed)"
+        elif len(states[component]) == 0:
+            state = "clean"
         else:
-            sys.stderr.write("Failed: bad format of stream/baseline config: ")
-            sys.stderr.write("type '" + type + "' is not supported.")
-            sys.exit(2)
+            state = ", ".join(states[component])
+        print(component.ljust(width) + "  " + state)
             
 def upload_usage():
     print("""
 Upload/deliver local modifications to remote repositories.
 
-Usage: cmg upload [-h|--help] [<tag>|<remote-tracking branch>|<local branch>]
+Usage: cmg upload [-h|--help] [--non-interactive] [--dirty <policy>]
+                  [--conflict <policy>] [<tag>|<remote-tracking branch>|<local branch>]
 
     (no paramater)      upload current stream
     -h, --help          help
+    --non-interactive   never ask, fail instead if a question is not answered
+                        by an option below
+    --dirty abort|stash|reset|commit
+                        what to do with local modifications in a working tree
+    --conflict abort|skip
+                        what to do if rebase/merge has conflicts
     <tag>               tag name that indicate the baseline to upload
     <remote-tracking branch>
                         must be the current remote-tracking branch name 
@@ -261,28 +419,23 @@ def upload(args):
     """Upload/deliver local modifications to remote repositories."""
 
     point = ""
+    (args, cfgs) = parse_args(args, upload_usage, ('--non-interactive', '--dirty', '--conflict'))
     if len(args) == 0:
         pass
     elif len(args) > 1:
         sys.stderr.write("Failed: wrong format of command line paramaters.")
         upload_usage()
         sys.exit(2)
-    elif args[0] in ('-h', "--help"):
-        upload_usage()
-        sys.exit()
-    elif args[0][0] == '-':
-        sys.stderr.write("Failed: wrong format of command line paramaters.")
-        upload_usage()
-        sys.exit(2)
     else:
         point = args[0]
 
     root = common.get_root()
     git.get_cmg_cfg(root)
+    common.cfgs.update(cfgs)
     print("---- " + root)
     
     if common.cfgs['online']:
-        git.fetch(root)
+        git.fetch(root, b_force=True)
     else:
         sys.stderr.write("Failed: CMG is running under offline mode. No way to upload.")
         upload_usage()
@@ -344,25 +497,10 @@ def upload(args):
         config = common.get_baseline_cfg(root, tag, tag_annotation)
         
     for component in config.sections():
-        if not config.has_option(component, 'type'):
-            sys.stderr.write("Failed: bad format of stream/baseline config: ")
-            sys.stderr.write("No 'type' option in '" + component + "' section.")
-            sys.exit(2)
-        
-        type = config.get(component, 'type')
-        if type.lower() == 'git':
-            git.upload(root, config, component)
-        elif type.lower() == 'svn' or type.lower() == 'subversion':
-            svn.upload(root, config, component)
-        elif type.lower() == 'fl' or type.lower() == 'file':
-            file.upload(root, config, component)
-        elif type.lower() == 'dir' or type.lower() == 'directory':
-            file.upload(root, config, component)
-        else:
-            sys.stderr.write("Failed: bad format of stream/baseline config: ")
-            sys.stderr.write("type '" + type + "' is not supported.")
-            sys.exit(2)
+        common.set_component(component)
+        backends.get_backend(config, component).upload(root, config, component)
 
+    common.set_component(".")
     print("---- (back to) " + root)
     if tag == "":
         if common.cfgs['gitrebase']:
@@ -378,9 +516,19 @@ def freeze_usage():
     print("""
 Create baseline.
 
-Usage: cmg freeze -h|--help|<tag> [<old_tag>]
+Usage: cmg freeze -h|--help|[-j <n>] [--refresh] [--non-interactive]
+                  [--dirty <policy>] [--freeze-point <policy>] <tag> [<old_tag>]
 
     -h, --help          help
+    -j, --jobs <n>      check <n> components at the same time
+    --refresh           fetch even if fetched within cmg.fetchttl seconds
+    --non-interactive   never ask, fail instead if a question is not answered
+                        by an option below
+    --dirty abort|stash|reset|commit
+                        what to do with local modifications in a working tree
+    --freeze-point revision|tag|baseline-tag
+                        what to record for a component not on a tag of the
+                        old baseline
     <tag>               tag name that indicate the baseline to create
     <old_tag>           existing tag to be the base to edit
 """)
@@ -389,17 +537,12 @@ def freeze(args):
     """Create baseline."""
 
     tag = old_tag = ""
+    (args, cfgs) = parse_args(args, freeze_usage, \
+        ('-j', '--refresh', '--non-interactive', '--dirty', '--freeze-point'))
     if len(args) == 0 or len(args) > 2:
         sys.stderr.write("Failed: wrong format of command line paramaters.")
         freeze_usage()
         sys.exit(2)
-    elif args[0] in ('-h', "--help"):
-        freeze_usage()
-        sys.exit()
-    elif args[0][0] == '-':
-        sys.stderr.write("Failed: wrong format of command line paramaters.")
-        freeze_usage()
-        sys.exit(2)
     else:
         tag = args[0]
     if len(args) == 2:
@@ -407,6 +550,7 @@ def freeze(args):
 
     root = common.get_root()
     git.get_cmg_cfg(root)
+    common.cfgs.update(cfgs)
     print("---- " + root)
 
     if common.cfgs['online']:
@@ -430,28 +574,43 @@ def freeze(args):
             sys.exit(2)
         tag_annotation = git.get_tag_annotation(root, old_tag)
         config_ref = common.get_baseline_cfg(root, old_tag, tag_annotation)
-        
+    points_ref = get_points(config_ref) #config_ref may be config_now, which is to change
+
+    components = config_now.sections()
+    if old_tag:
+        unchanged = find_unchanged(root, config_now, config_ref)
+        for component in unchanged:
+            keep_point(config_now, config_ref, component)
+        if len(unchanged) != 0:
+            print("Still on previous tag/revision in " + str(len(unchanged)) + " component(s), see below.")
+        components = [component for component in components if component not in unchanged]
+
+    new_tags = {}
+    failures = []
+    if common.cfgs['jobs'] > 1:
+        tasks = []
+        for component in components:
+            tasks.append((component, freeze_component, (root, config_now, config_ref, component, tag, new_tags)))
+        failures = common.run_parallel(tasks, common.cfgs['jobs'], True)
+    else:
+        for component in components:
+            freeze_component(root, config_now, config_ref, component, tag, new_tags)
+
+    common.set_component(".")
+    report_failures(failures, "freeze") #before any tag is created
+
+    tasks = []
     for component in config_now.sections():
-        if not config_now.has_option(component, 'type'):
-            sys.stderr.write("Failed: bad format of stream/baseline config: ")
-            sys.stderr.write("No 'type' option in '" + component + "' section.")
-            sys.exit(2)
-        
-        type = config_now.get(component, 'type')
-        if type.lower() == 'git':
-            git.freeze(root, config_now, config_ref, component, tag)
-        elif type.lower() == 'svn' or type.lower() == 'subversion':
-            svn.freeze(root, config_now, config_ref, component, tag)
-        elif type.lower() == 'fl' or type.lower() == 'file':
-            file.freeze(root, config_now, config_ref, component, tag)
-        elif type.lower() == 'dir' or type.lower() == 'directory':
-            file.freeze(root, config_now, config_ref, component, tag)
-        else:
-            sys.stderr.write("Failed: bad format of stream/baseline config: ")
-            sys.stderr.write("type '" + type + "' is not supported.")
-            sys.exit(2)
+        for (new_tag, func, args) in new_tags.get(component, []):
+            tasks.append((component, func, args))
+    if len(tasks) != 0:
+        print("---- create " + str(len(tasks)) + " tag(s) of components")
+        failures = common.run_parallel(tasks, common.cfgs['jobs'], True)
+        common.set_component(".")
+        report_failures(failures, "create tag of")
 
     print("---- (back to) " + root)
+    print_changes(config_now.sections(), points_ref, get_points(config_now), new_tags, old_tag)
 
     bl_cfg_fl_name = os.path.join(root, ".git", common.BASELINEFILE)
     try:
@@ -475,12 +634,86 @@ def freeze(args):
     bl_cfg_fl.close()
     
     print("Now the baseline content was written to file '" + bl_cfg_fl_name + "'. Pls review/revise it.")
-    print("1: reviewed. pls continue\n2: quit")
-    while True:
-        choice = input("? ")
-        if choice == '2':
-            sys.exit()
-        elif choice == '1':
-            break
+    if common.cfgs['interactive']:
+        print("1: reviewed. pls continue\n2: quit")
+        while True:
+            choice = common.ask("? ")
+            if choice == '2':
+                sys.exit()
+            elif choice == '1':
+                break
 
     git.create_tag(root, tag, bl_cfg_fl_name)
+
+def freeze_component(root, config_now, config_ref, component, tag, new_tags):
+    """Find out tag or revision of a component according to its type, and put
+    tags to create for it into dict `new_tags', as a list of (tag, function,
+    arguments)."""
+
+    common.set_component(component)
+    new_tags[component] = []
+    backends.get_backend(config_now, component).freeze(root, config_now, config_ref, component, tag, \
+        new_tags[component])
+
+def find_unchanged(root, config_now, config_ref):
+    """Find out components still on their tag or revision in baseline
+    `config_ref', in one quick pass of each backend which can (see
+    find_unchanged() of git.py and svn.py), which don't need to be frozen
+    again."""
+
+    components = [component for component in config_now.sections() if config_ref.has_option(component, 'type') \
+        and config_ref.get(component, 'type').lower() == config_now.get(component, 'type', fallback="").lower()]
+
+    unchanged = []
+    for (backend, components) in group_by_backend(config_now, components).items():
+        if hasattr(backend, 'find_unchanged'):
+            unchanged = unchanged + backend.find_unchanged(root, config_ref, components)
+    return [component for component in config_now.sections() if component in unchanged]
+
+def keep_point(config_now, config_ref, component):
+    """Copy the tag or revision of a component from baseline `config_ref'."""
+
+    for option in ('branch', 'tag', 'revision', 'branch_url', 'tags_url'):
+        if config_now.has_option(component, option):
+            config_now.remove_option(component, option)
+        if config_ref.has_option(component, option):
+            config_now.set(component, option, config_ref.get(component, option))
+
+def get_points(config):
+    """Get a dict of the point (such as ('tag', 'v1.0')) of each component in
+    stream/baseline `config'."""
+
+    points = {}
+    for component in config.sections():
+        points[component] = ("", "")
+        for option in ('tag', 'revision', 'branch', 'url'):
+            if config.has_option(component, option):
+                points[component] = (option, config.get(component, option))
+                break
+    return points
+
+def print_changes(components, points_ref, points_now, new_tags, old_tag):
+    """Show a table of what changed for each component of the new baseline,
+    compared with `old_tag' (or the stream if not given)."""
+
+    components = components + sorted([component for component in points_ref if component not in points_now])
+    width = max([len("component")] + [len(component) for component in components])
+    if old_tag:
+        print("---- changes since baseline '" + old_tag + "'")
+    else:
+        print("---- changes since the stream")
+    print("component".ljust(width) + "  change")
+    for component in components:
+        (type_ref, point_ref) = points_ref.get(component, ("", ""))
+        (type_now, point_now) = points_now.get(component, ("", ""))
+        if component not in points_ref:
+            change = "added, " + type_now + " '" + point_now + "'"
+        elif component not in points_now:
+            change = "removed"
+        elif (type_ref, point_ref) == (type_now, point_now):
+            change = "unchanged, " + type_now + " '" + point_now + "'"
+        else:
+            change = type_ref + " '" + point_ref + "' -> " + type_now + " '" + point_now + "'"
+        if point_now in [new_tag for (new_tag, func, args) in new_tags.get(component, [])]:
+            change = change + " (new tag)"
+        print(component.ljust(width) + "  " + change)
@@ -4,6 +4,15 @@ import os
 import sys
 import subprocess
 import re
+import shlex
+import json
+import time
+import asyncio
+import threading
+import traceback
+import contextlib
+import urllib.parse
+import concurrent.futures
 import configparser  #for Python 3.x
 #import ConfigParser  #for Python 2.x
 
@@ -15,7 +24,25 @@ BASELINEFILE = "_baseline" # The file in .git in container which stores the base
 cfgs = {'verbose': False, \
     'gitrebase': True, \
     'online': True, \
-    'addnewfile': True}
+    'addnewfile': True, \
+    'jobs': 1, \
+    'untrackedcache': False, \
+    'fsmonitor': False, \
+    'tagcontains': False, \
+    'depth': 0, \
+    'filter': "", \
+    'singlebranch': False, \
+    'cachedir': "", \
+    'narrowfetch': False, \
+    'fetchttl': 0, \
+    'svntipttl': 0, \
+    'svnwcdb': False, \
+    'hostjobs': 4, \
+    'timeout': 0, \
+    'interactive': True, \
+    'dirty': "", \
+    'conflict': "", \
+    'freezepoint': ""}
 """Some global CMG configuations that alternate CMG's behavior.
 
 * verbose: True if you want CMG show verbose information.
@@ -25,46 +52,635 @@ and all components under Git.
 * online: False if you can not / do not want link to remote repository/place
 to download from / upload to. Accordingly, Git will not 'git fetch', and SVN
 can not 'svn update', 'svn commit' etc.
+* addnewfile: True if you want new files to be added when commit.
+* jobs: how many components to handle at the same time. 1 means one by one.
+* untrackedcache: True if you want Git to use untracked cache to check status.
+* fsmonitor: True if you want Git to use file system monitor to check status.
+* tagcontains: True if a component under Git is regarded as on a tag when the
+tag contains HEAD in its history, not only when the tag points to HEAD.
+* depth, filter, singlebranch: default options of partial clone of a component
+under Git: how many commits of history to clone (0 for all), the filter of
+objects to clone (such as 'blob:none'), and True to clone only the branch/tag
+to follow. See get_clone_options() in git.py.
+* cachedir: the directory to keep a bare mirror of each Git remote repository,
+shared by components in all workspaces on this machine. "" for no cache. See
+update_mirror() in git.py.
+* narrowfetch: True if you want to fetch only the branch/tag/revision a component
+under Git follows, instead of all branches and tags. See get_narrow_refspecs()
+in git.py.
+* fetchttl: the number of seconds in which a repository under Git (or a mirror
+in cachedir) fetched successfully is not fetched again. 0 to always fetch.
+Option --refresh of a command sets it to 0. See is_fetched() in git.py.
+* svntipttl: the number of seconds in which the youngest revision of an SVN
+repository found out is used again, instead of asking the server. 0 to ask
+in each command. Option --refresh sets it to 0. See get_tip() in svn.py.
+* svnwcdb: True if you want the url and revision of an SVN working copy to be
+read from its .svn/wc.db directly, instead of via 'svn info'. See read_wc_db()
+in svn.py.
+* hostjobs: how many components to fetch from the same server at the same time,
+when jobs > 1. 0 means no limit. See get_host_slot().
+* timeout: the number of seconds a git/svn command may run before it's killed
+(unless it's interactive). 0 means no limit. See command().
+* interactive: False if CMG should never ask user, such as in CI. A question
+which is not answered by a policy below fails the command. See ask().
+* dirty: what to do with local modifications in a working tree which is to be
+checked out/updated/frozen: 'abort', 'stash', 'reset' or 'commit'. "" to ask
+user, or 'abort' if not interactive.
+* conflict: what to do if rebase/merge has conflicts: 'abort' (fail) or 'skip'
+(leave the component as before and go on), or if `svn switch' has conflicts:
+'abort' (fail) or 'skip' (leave them postponed and go on). "" to ask user, or
+'abort' if not interactive.
+* freezepoint: what to record for a component which is not on a tag of the
+old baseline when freeze: 'revision', 'tag' (an existing tag on it, or a new
+tag named as the baseline) or 'baseline-tag' (a new tag named as the
+baseline). "" to ask user.
 
 All these values may changed when initialize. See get_cmg_cfg(root) in git.py
 """
 
+POLICIES = {'dirty': ("abort", "stash", "reset", "commit"), \
+    'conflict': ("abort", "skip"), \
+    'freezepoint': ("revision", "tag", "baseline-tag")}
+"""Valid values of CMG configurations which answer questions. See get_policy()."""
 
-def command(cmd, dir):
-    """ To run a command line. `cmd' is the command line. `dir' is the working
-    directory to run the command line. Return output msg, err/warn msg, as well
-    as the exit code.
+def get_policy(key):
+    """Get the policy (CMG configuration `key', see POLICIES) to answer a
+    question without asking. Return "" if user should be asked. If CMG is not
+    interactive, 'dirty' and 'conflict' are 'abort' by default."""
+
+    policy = cfgs[key]
+    if policy == "" and not cfgs['interactive'] and key != 'freezepoint':
+        return "abort"
+    return policy
+
+
+_trace = None #records of commands when tracing, see start_trace()
+_trace_file = ""
+_trace_lock = threading.Lock()
+_trace_start = 0.0
+_component = threading.local() #the component the current thread works on, see set_component()
+
+def set_component(component):
+    """Set the component the current thread works on, to show in the trace."""
+
+    _component.name = component
+
+def get_component():
+    """Get the component the current thread works on ('.' for container)."""
+
+    return getattr(_component, 'name', ".")
+
+def get_parents(component, components):
+    """Get components in whose directory `component' lies."""
+
+    path = re.split(r"[\\/]+", component.strip("\\/"))
+    parents = []
+    for other in components:
+        other_path = re.split(r"[\\/]+", other.strip("\\/"))
+        if other != component and path[:len(other_path)] == other_path:
+            parents.append(other)
+    return parents
+
+def start_trace(file):
+    """Start to record every command, to write into `file' by stop_trace()."""
+
+    global _trace, _trace_file, _trace_start
+    _trace = []
+    _trace_file = file
+    _trace_start = time.perf_counter()
+
+def trace(component, cmd, dir, start, end, code, stdoutdata="", stderrdata=""):
+    """Record a command run from `start' to `end' (time.perf_counter()) if
+    tracing. `code' is None for a command still running, such as a pipe."""
+
+    if _trace is None:
+        return
+    if isinstance(cmd, str):
+        argv = [cmd]
+    else:
+        argv = list(cmd)
+    with _trace_lock:
+        _trace.append({'component': component, 'argv': argv, 'cwd': dir, \
+            'start': start - _trace_start, 'end': end - _trace_start, 'code': code, \
+            'stdout': len(stdoutdata.encode('utf-8')), 'stderr': len(stderrdata.encode('utf-8')), \
+            'thread': threading.current_thread().name})
+
+def stop_trace(top=10):
+    """Stop tracing, write the records into the trace file in Chrome
+    trace-event format (which opens in Perfetto or chrome://tracing), and show
+    the `top' slowest commands."""
+
+    global _trace
+    if _trace is None:
+        return
+    records = _trace
+    _trace = None
+
+    threads = {}
+    events = []
+    for record in records:
+        if record['thread'] not in threads:
+            threads[record['thread']] = len(threads) + 1
+            events.append({'name': "thread_name", 'ph': "M", 'pid': 1, \
+                'tid': threads[record['thread']], 'args': {'name': record['thread']}})
+        args = dict(record)
+        args['cmd'] = cmdline(record['argv'])
+        del args['thread'], args['start'], args['end']
+        events.append({'name': record['component'] + ": " + " ".join(record['argv'][:2]), \
+            'cat': record['argv'][0], 'ph': "X", 'pid': 1, 'tid': threads[record['thread']], \
+            'ts': round(record['start'] * 1000000), \
+            'dur': round((record['end'] - record['start']) * 1000000), 'args': args})
+    try:
+        with open(_trace_file, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': "ms", \
+                'otherData': {'argv': sys.argv, 'version': VERSION}}, f, indent=1)
+    except:
+        sys.stderr.write("Failed: can not write trace file '" + _trace_file + "':\n" + str(sys.exc_info()[1]))
+        return
+
+    total = time.perf_counter() - _trace_start
+    print("\n---- trace: " + str(len(records)) + " command(s) in " + "%.3fs" % total + \
+        ", written to '" + _trace_file + "'")
+    slowest = sorted(records, key=lambda record: record['start'] - record['end'])[:top]
+    if len(slowest) > 0:
+        width = max([len(record['component']) for record in slowest] + [len("component")])
+        print("seconds  " + "component".ljust(width) + "  command")
+        for record in slowest:
+            print("%7.3f  " % (record['end'] - record['start']) + record['component'].ljust(width) + \
+                "  " + cmdline(record['argv']))
+
+_loop = None #the event loop running all commands, see get_loop()
+_loop_lock = threading.Lock()
+
+def get_loop():
+    """Get the event loop which runs commands, in a background thread started
+    at the first call."""
+
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="cmg-commands", daemon=True)
+            thread.start()
+            _loop = loop
+        return _loop
+
+def cmdline(cmd):
+    """Get the command line `cmd' (a string, or a list of arguments) as a
+    string to show."""
+
+    if isinstance(cmd, str):
+        return cmd
+    return " ".join([shlex.quote(arg) for arg in cmd])
+
+async def run_command(cmd, dir, timeout=None, env=None, b_capture=True, component="."):
+    """Run a command line on the event loop. 
+    
+    `cmd' is a list of arguments, or a string to run via shell. `dir' is the
+    working directory. `timeout' is the number of seconds before it's killed
+    (None or 0 for no limit). `env' is a dict of environment variables to
+    overwrite. If `b_capture' is True, stdout/stderr is captured, otherwise
+    it's shown directly, and stdin is kept too. If the coroutine is cancelled,
+    the command is killed. `component' is what to record in the trace, see
+    trace(). Return output msg, err/warn msg, as well as the exit code.
+    """
+
+    start = time.perf_counter()
+
+    if env is not None:
+        env = dict(os.environ, **env)
+    pipe = None
+    if b_capture:
+        pipe = asyncio.subprocess.PIPE
+    try:
+        if isinstance(cmd, str):
+            proc = await asyncio.create_subprocess_shell(cmd, cwd=dir, env=env, \
+                stdin=asyncio.subprocess.DEVNULL if b_capture else None, stdout=pipe, stderr=pipe)
+        else:
+            proc = await asyncio.create_subprocess_exec(*cmd, cwd=dir, env=env, \
+                stdin=asyncio.subprocess.DEVNULL if b_capture else None, stdout=pipe, stderr=pipe)
+    except OSError as err:
+        trace(component, cmd, dir, start, time.perf_counter(), 127)
+        return ("", "Can not run " + cmdline(cmd) + ": " + str(err) + "\n", 127)
+
+    try:
+        (stdoutdata, stderrdata) = await asyncio.wait_for(proc.communicate(), timeout or None)
+    except asyncio.TimeoutError:
+        proc.kill()
+        (stdoutdata, stderrdata) = await proc.communicate()
+        stderrdata = (stderrdata or b"") + ("Killed after " + str(timeout) + " seconds.\n").encode()
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        trace(component, cmd, dir, start, time.perf_counter(), proc.returncode)
+        raise
+
+    stdoutdata = (stdoutdata or b"").decode('utf-8', 'replace').replace("\r\n", "\n")
+    stderrdata = (stderrdata or b"").decode('utf-8', 'replace').replace("\r\n", "\n")
+    trace(component, cmd, dir, start, time.perf_counter(), proc.returncode, stdoutdata, stderrdata)
+    return (stdoutdata, stderrdata, proc.returncode)
+
+def run_sync(coroutine):
+    """Run `coroutine' on the event loop of commands, and wait for its result.
+    It's cancelled if the waiting is interrupted (such as by Ctrl-C)."""
+
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_loop())
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()
+        raise
+
+def command(cmd, dir, timeout=None, env=None):
+    """ To run a command line. `cmd' is the command line, a list of arguments
+    (or a string to run via shell). `dir' is the working directory to run the
+    command line. `timeout' is the number of seconds before the command is
+    killed, CMG configuration `timeout' if None. `env' is a dict of
+    environment variables to overwrite. Return output msg, err/warn msg, as
+    well as the exit code.
     """
    
     if cfgs['verbose']:
-        print("\n[call cmd] " + cmd)
+        print("\n[call cmd] " + cmdline(cmd))
         print("[in dir] " + dir)
 
-    pipe = subprocess.Popen(cmd, shell=True, cwd=dir, universal_newlines=True,\
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE )
-    (stdoutdata, stderrdata) = pipe.communicate()
+    if timeout is None:
+        timeout = cfgs['timeout']
+    (stdoutdata, stderrdata, code) = run_sync(run_command(cmd, dir, timeout, env, True, get_component()))
     
     if cfgs['verbose']:
         print("[output msg]\n" + stdoutdata)
         print("[err/warn msg] " + stderrdata)
-        print("[exit code] " + str(pipe.returncode))
+        print("[exit code] " + str(code))
     
-    return (stdoutdata, stderrdata, pipe.returncode)
+    return (stdoutdata, stderrdata, code)
+
+
+def command_many(cmds, timeout=None, env=None):
+    """ To run several command lines at the same time. `cmds' is a list of
+    (cmd, dir), see command(). Return a list of (output msg, err/warn msg,
+    exit code), in the same order.
+    """
+
+    if cfgs['verbose']:
+        for (cmd, dir) in cmds:
+            print("\n[call cmd] " + cmdline(cmd))
+            print("[in dir] " + dir)
 
+    if timeout is None:
+        timeout = cfgs['timeout']
 
-def command_free(cmd, dir):
+    async def run_all():
+        return await asyncio.gather(*[run_command(cmd, dir, timeout, env, True, component) \
+            for (cmd, dir) in cmds])
+
+    component = get_component()
+
+    results = run_sync(run_all())
+
+    if cfgs['verbose']:
+        for ((cmd, dir), (stdoutdata, stderrdata, code)) in zip(cmds, results):
+            print("\n[result of] " + cmdline(cmd))
+            print("[output msg]\n" + stdoutdata)
+            print("[err/warn msg] " + stderrdata)
+            print("[exit code] " + str(code))
+
+    return results
+
+
+def command_free(cmd, dir, env=None):
     """ To run a command line interactively, and without monitor the result.
-    `cmd' is the command line. `dir' is the working directory to run the command line.
+    `cmd' is the command line, a list of arguments (or a string to run via
+    shell). `dir' is the working directory to run the command line. `env' is a
+    dict of environment variables to overwrite. Return the exit code.
+
+    It's for a command which talks with user, such as one opening an editor,
+    so in a worker thread of run_parallel() it's run the same way as ask()
+    asks a question, see prompting(). Run other commands via command().
+    """
+
+    if cfgs['verbose']:
+        print("\n[call cmd] " + cmdline(cmd))
+        print("[in dir] " + dir)
+
+    with prompting():
+        return run_sync(run_command(cmd, dir, None, env, False, get_component()))[2]
+
+
+def command_pipe(cmd, dir):
+    """ To start a command line which keeps running, to talk with it via pipes.
+    `cmd' is the command line, a list of arguments (or a string to run via
+    shell). `dir' is the working directory to run the command line. Return the
+    subprocess.Popen object, whose stdin and stdout are binary pipes.
     """
 
     if cfgs['verbose']:
-        print("\n[call cmd] " + cmd)
+        print("\n[open pipe] " + cmdline(cmd))
         print("[in dir] " + dir)
 
-    pipe = subprocess.Popen(cmd, shell=True, cwd=dir, universal_newlines=True)
-    pipe.communicate()
+    now = time.perf_counter()
+    trace(get_component(), cmd, dir, now, now, None)
+    return subprocess.Popen(cmd, shell=isinstance(cmd, str), cwd=dir, \
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+
+_local = threading.local() #per thread data. `buffer' is set in a worker of run_parallel(), `slots' in HostSlot
+_console = threading.RLock() #held when write a block of output or ask a question
+_prompt_gate = threading.Event() #cleared while run_pipeline() is fetching, see ask()
+_prompt_gate.set()
+_host_slots = {} #semaphore of each server, see get_host_slot()
+_host_lock = threading.Lock()
+
+class ThreadOutput:
+    """A wrap on sys.stdout / sys.stderr when components are handled in parallel.
     
-    return pipe.returncode
+    What a worker thread of run_parallel() writes is kept in the worker's buffer,
+    to be shown as one block later. What other threads write goes through.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, string):
+        buffer = getattr(_local, 'buffer', None)
+        if buffer is None:
+            with _console:
+                return self.stream.write(string)
+        buffer.append((self.stream, string))
+        return len(string)
+
+    def flush(self):
+        if getattr(_local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def flush_buffer():
+    """Show what the current worker thread has written so far. Do nothing if
+    it's not in a worker thread."""
+
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is None:
+        return
+    with _console:
+        for (stream, string) in buffer:
+            stream.write(string)
+        for stream in set([stream for (stream, string) in buffer]):
+            stream.flush()
+    del buffer[:]
+
+
+@contextlib.contextmanager
+def prompting():
+    """Talk with user in a `with' statement. Nothing special if not in a worker
+    thread of run_parallel(). In a worker thread, it waits until run_pipeline()
+    has fetched all components, releases slots of servers (see
+    get_host_slot()) the worker holds, otherwise the fetches waiting for them
+    would never be done, and then shows what the worker wrote and holds the
+    console, so that only one worker talks with user at a time."""
+
+    if getattr(_local, 'buffer', None) is None:
+        yield
+        return
+
+    slots = list(getattr(_local, 'slots', []))
+    for slot in slots:
+        slot.release()
+    try:
+        _prompt_gate.wait()
+        with _console:
+            flush_buffer()
+            yield
+    finally:
+        for slot in slots:
+            slot.acquire()
+
+def ask(prompt):
+    """Ask user a question and return the answer, the same as input().
+    
+    If CMG configuration `interactive' is False, it fails instead of waiting
+    for an answer that never comes.
+    
+    In a worker thread of run_parallel(), what the worker wrote is shown first,
+    and only one question is asked at a time. In run_pipeline(), questions wait
+    until all components are fetched, so that the user is not bothered while
+    slow transfers are still going on. See prompting().
+    """
+
+    if not cfgs['interactive']:
+        sys.stderr.write("Failed: CMG is running non-interactively, but it has to ask '" + prompt.strip() + \
+            "' here. See options --dirty, --conflict and --freeze-point.\n")
+        sys.exit(2)
+    if getattr(_local, 'buffer', None) is None:
+        return input(prompt)
+    stdout = sys.stdout
+    if isinstance(stdout, ThreadOutput):
+        stdout = stdout.stream
+    with prompting():
+        stdout.write(prompt)
+        stdout.flush()
+        return input()
+
+
+def get_host(url):
+    """Get the server's name of `url', such as 'example.com' of
+    'https://example.com/a.git' or 'git@example.com:a.git'. Return "" for a
+    local path."""
+
+    if re.match(r"^[A-Za-z][A-Za-z0-9+.-]*://", url):
+        return (urllib.parse.urlsplit(url).hostname or "").lower()
+    m = re.match(r"^(?:[^@/]+@)?([^:/]{2,}):", url) #scp-like syntax of Git
+    if m:
+        return m.group(1).lower()
+    return ""
+
+class HostSlot:
+    """A slot of a server taken in `with' statement, see get_host_slot(). The
+    slots a thread holds are recorded, to be released while it asks a
+    question, see ask()."""
+
+    def __init__(self, semaphore):
+        self.semaphore = semaphore
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        if getattr(_local, 'slots', None) is None:
+            _local.slots = []
+        _local.slots.append(self.semaphore)
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.slots.remove(self.semaphore)
+        self.semaphore.release()
+        return False
+
+def get_host_slot(url):
+    """Get a slot to talk to the server of `url', to be used in `with'
+    statement. At most CMG configuration `hostjobs' slots of a server are
+    taken at the same time."""
+
+    if cfgs['hostjobs'] <= 0:
+        return contextlib.nullcontext()
+    host = get_host(url)
+    with _host_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(cfgs['hostjobs'])
+        return HostSlot(_host_slots[host])
+
+
+def _run_task(func, args, buffer=None, name="."):
+    """Run a task named `name' in a worker thread of run_parallel(). Return
+    what it wrote, and its exit code if it exited (None if not). What it
+    writes is appended to `buffer' if given."""
+
+    set_component(name)
+    if buffer is None:
+        buffer = []
+    _local.buffer = buffer
+    code = None
+    try:
+        func(*args)
+    except SystemExit as err:
+        code = err.code
+        if code is None:
+            code = 0
+    except:
+        traceback.print_exc()
+        code = 2
+    buffer = _local.buffer
+    _local.buffer = None
+    return (buffer, code)
+
+
+def run_parallel(tasks, jobs, ordered=False):
+    """Run `tasks' on `jobs' worker threads.
+    
+    `tasks' is a list of (name, function, arguments). What a task writes is
+    shown as one block when the task finishes: in the order of `tasks' if
+    `ordered' is True, otherwise as soon as it finishes. A task that exits via
+    sys.exit() does not stop others. Return a list of (name, exit code) of such
+    tasks.
+    """
+
+    failures = []
+    stdout = sys.stdout
+    stderr = sys.stderr
+    sys.stdout = ThreadOutput(stdout)
+    sys.stderr = ThreadOutput(stderr)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = {}
+            for (index, (name, func, args)) in enumerate(tasks):
+                futures[pool.submit(_run_task, func, args, None, name)] = (index, name)
+            if ordered:
+                done = [future for future in futures]
+            else:
+                done = concurrent.futures.as_completed(futures)
+            for future in done:
+                (buffer, code) = future.result()
+                with _console:
+                    for (stream, string) in buffer:
+                        stream.write(string)
+                    stdout.flush()
+                    stderr.flush()
+                if code is not None:
+                    failures.append(futures[future] + (code,))
+    finally:
+        sys.stdout = stdout
+        sys.stderr = stderr
+
+    failures.sort()
+    return [(name, code) for (index, name, code) in failures]
+
+
+def _run_fetch(stage, waits, name):
+    """Run the fetch stage of task `name' in run_pipeline(), after `waits'
+    (futures of fetch stages of other tasks) are done."""
+
+    for future in waits:
+        future.result()
+    if stage is None:
+        return ([], None)
+    return _run_task(stage[0], stage[1], None, name)
+
+def _run_apply(stage, fetched, waits, name):
+    """Run the local stage of task `name' in run_pipeline(), after `fetched' (the
+    future of its fetch stage) and `waits' (futures of local stages of other
+    tasks) are done. It is skipped if the fetch stage exited."""
+
+    (buffer, code) = fetched.result()
+    if code is not None:
+        return (buffer, code)
+    for future in waits:
+        future.result()
+    if stage is None:
+        return (buffer, None)
+    return _run_task(stage[0], stage[1], buffer, name)
+
+def run_pipeline(tasks, jobs):
+    """Run `tasks' in two stages: fetch from remote on `jobs' worker threads
+    (at most CMG configuration `hostjobs' of them on a server, see
+    get_host_slot()), and work on local on another `jobs' worker threads, so
+    that network waits overlap with local work.
+    
+    `tasks' is a list of (name, fetch, apply, after): `fetch' and `apply' are
+    (function, arguments) of the stages, or None; `after' lists names of the
+    tasks whose stages must be done before the same stage of this task. Tasks
+    in `after' must come before this task in `tasks'. The local stage of a task
+    starts as soon as its fetch stage is done, and is skipped if the fetch
+    stage exits via sys.exit(). What a task writes is shown as one block when
+    it finishes. Questions via ask() wait until all fetch stages are done.
+    Return a list of (name, exit code) of tasks that exited.
+    """
+
+    failures = []
+    stdout = sys.stdout
+    stderr = sys.stderr
+    sys.stdout = ThreadOutput(stdout)
+    sys.stderr = ThreadOutput(stderr)
+    remaining = [len(tasks)]
+    lock = threading.Lock()
+
+    def fetch_done(future):
+        with lock:
+            remaining[0] = remaining[0] - 1
+            if remaining[0] == 0:
+                _prompt_gate.set()
+
+    _prompt_gate.clear()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as fetch_pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as apply_pool:
+            fetched = {}
+            applied = {}
+            futures = {}
+            for (index, (name, fetch, apply, after)) in enumerate(tasks):
+                fetched[name] = fetch_pool.submit(_run_fetch, fetch, \
+                    [fetched[other] for other in after], name)
+                fetched[name].add_done_callback(fetch_done)
+                applied[name] = apply_pool.submit(_run_apply, apply, fetched[name], \
+                    [applied[other] for other in after], name)
+                futures[applied[name]] = (index, name)
+            if len(tasks) == 0:
+                _prompt_gate.set()
+            for future in concurrent.futures.as_completed(futures):
+                (buffer, code) = future.result()
+                with _console:
+                    for (stream, string) in buffer:
+                        stream.write(string)
+                    stdout.flush()
+                    stderr.flush()
+                if code is not None:
+                    failures.append(futures[future] + (code,))
+    finally:
+        _prompt_gate.set()
+        sys.stdout = stdout
+        sys.stderr = stderr
+
+    failures.sort()
+    return [(name, code) for (index, name, code) in failures]
 
 
 DEFAULTSECT = "DEFAULT" #the defult section name. See codes in base class.
@@ -1,6 +1,7 @@
 import sys
 import os
 import shutil
+import time
 
 
 from cmglib import common
@@ -37,8 +38,10 @@ def write_egg(root, url):
 def copy_file(root, url):
     """copy a file from url to local."""
 
+    start = time.perf_counter()
     try:
         shutil.copy2(url, root)
+        common.trace(common.get_component(), ["copy", url, root], root, start, time.perf_counter(), 0)
     except:
         sys.stderr.write("Failed: can not copy file from  '" + url + "' to '" + root + "'.")
         sys.exit(2)
@@ -47,8 +50,10 @@ def copy_tree(root, url):
     """copy a directory from url to local."""
 
 
+    start = time.perf_counter()
     try:
         shutil.copytree(url, root)
+        common.trace(common.get_component(), ["copytree", url, root], root, start, time.perf_counter(), 0)
     except:
         sys.stderr.write("Failed: can not copy tree from  '" + url + "' to '" + root + "'.")
         sys.exit(2)
@@ -79,13 +84,17 @@ def remove(root):
 #
 
 
-def download(root, config, component, b_file):
+def download(root, config, component, b_file=None):
     """Download/sync/update a component from shared folder to working copy.
     
     `root' is the root of container. `config' stores the stream/baseline config.
-    `component' is the name of the component. 'b_file' indicates it's a file or dir.
+    `component' is the name of the component. 'b_file' indicates it's a file or dir,
+    according to its type ('fl'/'file' or 'dir'/'directory') if not given.
     """
 
+    if b_file is None:
+        b_file = config.get(component, "type").lower() in ('fl', 'file')
+
     root = os.path.join(root, component) #now it's the root of this component.
     print("---- " + root)
     
@@ -116,7 +125,8 @@ def status(root, config, component):
     """Show status of a component.
     
     `root' is the root of container. `config' stores the stream/baseline config.
-    `component' is the name of the component.
+    `component' is the name of the component. Return a list of what found out:
+    'missing' or 'off-branch'.
     """
 
     root = os.path.join(root, component) #now it's the root of this component.
@@ -132,10 +142,15 @@ def status(root, config, component):
     
     if not os.path.exists(root):
         print("Warning: this component doesn't exists in workspace.")
+        return ["missing"]
     elif current_url == "":
         print("Warning: can not get the source information from file '" + root + ".egg-info'.")
+        return ["off-branch"]
     elif current_url != url:
         print("Warning: this component should from '" + url + "', but now '" + current_url + "'.")
+        return ["off-branch"]
+
+    return []
 
 
 def upload(root, config, component):
@@ -147,8 +162,9 @@ def upload(root, config, component):
     print("No upload as it is just a file/dir not under version control. Pls do it manually if necessary.")
 
 
-def freeze(root, config_now, config_ref, component, baseline):
-    """Record the source url of the component."""
+def freeze(root, config_now, config_ref, component, baseline, new_tags):
+    """Record the source url of the component. No tag is created, so
+    `new_tags' is left as is."""
 
     root = os.path.join(root, component) #now it's the root of this component.
     print("---- " + root)
@@ -163,7 +179,7 @@ def freeze(root, config_now, config_ref, component, baseline):
         sys.exit(2)
     
     if config_ref.has_option(component, "url"):
-        url_ref = config.get(component, "url")
+        url_ref = config_ref.get(component, "url")
         if url_ref != url_now:
             print("The URL changes from '" + url_ref + "' to '" + url_now + "'.")
         else:
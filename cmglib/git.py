@@ -1,9 +1,145 @@
 import sys
 import os
 import re
+import threading
+import atexit
+import hashlib
+import time
+import zlib
+import collections
 
 from cmglib import common
 
+_refs = {} #snapshot of refs of each repository. See get_refs().
+
+def get_refs(root):
+    """Get a snapshot of refs of the repository via one `git for-each-ref'.
+    
+    Return a dict: 'heads' maps each local branch to its remote-tracking branch
+    ("" if none), 'remotes' is the set of remote-tracking branches (such as
+    origin/master), 'tags' maps each tag to the revision it points to, and
+    'current' is current local branch ("" if not on a local branch). The snapshot is kept until CMG changes
+    refs of the repository, see drop_refs().
+    """
+
+    if root in _refs:
+        return _refs[root]
+
+    cmd = ["git", "for-each-ref", "--format=%(HEAD) %(refname) %(upstream:short) %(symref) %(objectname) %(*objectname)"]
+    (out, err, code) = common.command(cmd, root)
+    if err:
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+        sys.exit(2)
+
+    refs = {'heads': {}, 'remotes': set(), 'tags': {}, 'current': ""}
+    for line in out.splitlines():
+        (refname, upstream, symref, object, peeled) = line[2:].split(" ")[:5]
+        if refname[:11] == "refs/heads/":
+            refs['heads'][refname[11:]] = upstream
+            if line[0] == "*":
+                refs['current'] = refname[11:]
+        elif refname[:13] == "refs/remotes/" and symref == "":
+            refs['remotes'].add(refname[13:])
+        elif refname[:10] == "refs/tags/":
+            if peeled != "": #an annotated tag points to a tag object
+                object = peeled
+            refs['tags'][refname[10:]] = object
+
+    _refs[root] = refs
+    return refs
+
+def drop_refs(root):
+    """Drop the snapshot of refs and the object reader, as CMG changed refs of
+    the repository."""
+
+    _refs.pop(root, None)
+    with _readers_lock:
+        reader = _readers.pop(root, None)
+    if reader != None:
+        reader.close()
+
+MAX_READERS = 16 #object readers kept open at most, the least recently used is closed. See get_object().
+_readers = collections.OrderedDict() #object reader of each repository, the most recently used at the end
+_readers_lock = threading.Lock()
+
+class ObjectReader:
+    """A `git cat-file --batch' process of a repository, kept open for the life
+    of the command, to look up objects via a pipe instead of starting a process
+    for each lookup."""
+
+    def __init__(self, root):
+        self.cmd = ["git", "cat-file", "--batch"]
+        self.pipe = common.command_pipe(self.cmd, root)
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """Return (revision, type, content) of an object, or None if not exists.
+        Return False if the reader is closed, see get_object()."""
+
+        with self.lock:
+            if self.pipe == None:
+                return False
+            try:
+                self.pipe.stdin.write(name.encode('utf-8') + b"\n")
+                self.pipe.stdin.flush()
+                header = self.pipe.stdout.readline().decode('utf-8').split(" ")
+                if len(header) != 3 or not header[2].strip().isdigit(): #"<name> missing" etc.
+                    return None
+                size = int(header[2])
+                content = self.pipe.stdout.read(size + 1)[:size] #followed by a newline
+            except (OSError, ValueError):
+                sys.stderr.write("Failed: " + common.cmdline(self.cmd) + " stopped unexpectedly.")
+                sys.exit(2)
+
+        return (header[0], header[1], content.decode('utf-8', 'replace'))
+
+    def close(self):
+        with self.lock:
+            if self.pipe == None:
+                return
+            try:
+                self.pipe.stdin.close()
+            except OSError:
+                pass
+            self.pipe.wait()
+            self.pipe = None
+
+def get_object(root, name):
+    """Look up an object of the repository, such as 'HEAD' or 'refs/tags/v1'.
+    Return (revision, type, content), or None if not exists.
+
+    At most MAX_READERS readers are kept open, so that the number of processes
+    and pipes does not grow with the number of components. A reader closed by
+    another thread meanwhile is just opened again.
+    """
+
+    while True:
+        evicted = []
+        with _readers_lock:
+            reader = _readers.pop(root, None)
+            if reader == None:
+                reader = ObjectReader(root)
+            _readers[root] = reader
+            while len(_readers) > MAX_READERS:
+                evicted.append(_readers.popitem(last=False)[1])
+        for other in evicted:
+            other.close()
+
+        object = reader.get(name)
+        if object != False:
+            return object
+
+def close_readers():
+    """Close all object readers."""
+
+    with _readers_lock:
+        readers = list(_readers.values())
+        _readers.clear()
+    for reader in readers:
+        reader.close()
+
+atexit.register(close_readers)
+
 def is_local_br(root, local):
     """Check if it is an existing local branch."""
     
@@ -13,18 +149,7 @@ def is_local_br(root, local):
     if local[:7] == "origin/":
         return False
 
-    cmd = "git branch"
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-
-    for line in out.splitlines():
-        match = re.match(r"\*?\s+" + local + r"$", line)
-        if match != None:
-            return True
-    
-    return False
+    return local in get_refs(root)['heads']
 
 def is_local_br_to_create(root, local):
     """Check if it is local branch that does not exist but has a corresponding remote-tracking branch."""
@@ -35,18 +160,7 @@ def is_local_br_to_create(root, local):
     if local[:7] == "origin/":
         return False
 
-    cmd = "git branch -r"
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-
-    for line in out.splitlines():
-        match = re.match(r"\s+" + "origin/" + local + r"$", line)
-        if match != None:
-            return True
-
-    return False
+    return "origin/" + local in get_refs(root)['remotes']
 
 def is_remote_br(root, remote):
     """Check if it is an existing remote-tracking branch."""
@@ -57,89 +171,126 @@ def is_remote_br(root, remote):
     if remote[:7] != "origin/":
         return False
 
-    cmd = "git branch -r"
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-
-    for line in out.splitlines():
-        match = re.match(r"\s+" + remote + r"$", line)
-        if match != None:
-            return True
-
-    return False
+    return remote in get_refs(root)['remotes']
 
 def is_tag(root, tag):
     """Check if it is an existing tag."""
 
-    cmd = "git tag -l " + tag
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-    
-    if out.strip() == tag:
-        return True
-    
-    return False
+    return tag in get_refs(root)['tags']
 
 def is_on_tag(root, tag):
-    """Check if it is currently on a tag."""
+    """Check if it is currently on a tag.
+    
+    If CMG configuration `tagcontains' is True, it is also regarded as on the
+    tag if the tag contains HEAD in its history, which is much slower.
+    """
 
-    cmd = "git tag -l " + tag + " --contains HEAD"
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
+    if common.cfgs['tagcontains']:
+        cmd = ["git", "tag", "-l", tag, "--contains", "HEAD"]
+        (out, err, code) = common.command(cmd, root)
+        if err:
+            sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+            sys.exit(2)
 
-    if out.strip() == tag:
-        return True
-    
-    return False
+        return out.strip() == tag
+
+    tags = get_refs(root)['tags']
+    return tag in tags and tags[tag] == get_current_revision(root)
 
 def is_revision(root, revision):
     """Check if it is an existing revision."""
 
-    cmd = "git log --pretty=oneline -1 " + revision
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-
-    match = re.match(revision, out)
-    if match != None:
-        return True
-
-    return False
+    object = get_object(root, revision + "^{commit}")
+    return object != None and object[0][:len(revision)] == revision
     
 def is_on_revision(root, revision):
     """Check if it is currently on this revision."""
 
-    cmd = "git log --pretty=oneline -1 HEAD"
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-    
-    match = re.match(revision, out)
-    if match != None:
-        return True
-
-    return False
+    revision_now = get_current_revision(root)
+    return revision_now != None and revision_now[:len(revision)] == revision
 
 def get_current_revision(root):
-    """Get current revision."""
+    """Get current revision. Return None if there is no revision yet."""
+
+    object = get_object(root, "HEAD")
+    if object != None:
+        return object[0]
+
+def read_ref(gitdir, refname):
+    """Read ref `refname' (such as 'HEAD' or 'refs/tags/v1') of repository
+    `gitdir' from the files, without starting git. Return (object, peeled
+    object of an annotated tag if known), or ("", "") if not found there."""
+
+    try:
+        with open(os.path.join(gitdir, *refname.split("/"))) as f:
+            value = f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        value = ""
+    if value[:5] == "ref: ":
+        return read_ref(gitdir, value[5:])
+    elif value != "":
+        return (value, "")
+
+    object = peeled = ""
+    try:
+        with open(os.path.join(gitdir, "packed-refs")) as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if line[:1] == "^":
+                    if object != "" and peeled == "":
+                        peeled = line[1:]
+                elif object != "":
+                    break
+                elif line[:1] != "#" and line.split(" ", 1)[1:] == [refname]:
+                    object = line.split(" ")[0]
+    except (OSError, UnicodeDecodeError):
+        pass
+    return (object, peeled)
+
+def peel_ref(gitdir, refname):
+    """Get the revision which ref `refname' of repository `gitdir' points to,
+    reading the files only. Return "" if it's unknown without starting git,
+    such as an annotated tag whose object is in a pack."""
+
+    (object, peeled) = read_ref(gitdir, refname)
+    for i in range(8): #a tag may point to another tag
+        if peeled != "" or object == "":
+            return peeled
+        try:
+            with open(os.path.join(gitdir, "objects", object[:2], object[2:]), 'rb') as f:
+                content = zlib.decompressobj().decompress(f.read(), 1024)
+        except (OSError, zlib.error):
+            return ""
+        if content[:7] == b"commit ":
+            return object
+        match = re.match(rb"tag \d+\0object ([0-9a-f]+)\n", content)
+        if match == None:
+            return ""
+        object = match.group(1).decode()
+    return ""
 
-    cmd = "git log --pretty=oneline -1 HEAD"
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-    
-    match = re.match(r"(\S+)\s+", out)
-    if match != None:
-        return match.group(1)
+def find_unchanged(root, config_ref, components):
+    """Find out which of `components' are still on their tag or revision in
+    baseline `config_ref', by reading HEAD and refs from files, without
+    starting git. A component is regarded as changed if it's unknown."""
+
+    unchanged = []
+    for component in components:
+        gitdir = os.path.join(root, component, ".git")
+        if not os.path.isdir(gitdir):
+            continue
+        head = read_ref(gitdir, "HEAD")[0] #always a commit
+        if head == "":
+            continue
+        if config_ref.has_option(component, "tag"):
+            refname = "refs/tags/" + config_ref.get(component, "tag")
+            if head in read_ref(gitdir, refname) or peel_ref(gitdir, refname) == head:
+                unchanged.append(component)
+        elif config_ref.has_option(component, "revision"):
+            revision_ref = config_ref.get(component, "revision")
+            if len(revision_ref) >= 4 and head[:len(revision_ref)] == revision_ref:
+                unchanged.append(component)
+    return unchanged
   
     
 def get_cmg_cfg(root):
@@ -155,52 +306,79 @@ def get_cmg_cfg(root):
             verbose = false
             gitrebase = true
             online = false
-    All these configurations have default values in common.py.
+            jobs = 4
+    All these configurations have default values in common.py. All of them
+    are read via one `git config --get-regexp'. A value is checked against the
+    type of the default value: true/false (also yes/no, on/off, 1/0) for a
+    True/False, a non-negative number for a number.
     """
     
-    for key in list(common.cfgs.keys()):
-        cmd = "git config cmg." + key
-        (out, err, code) = common.command(cmd, root)
-        if err:
-            sys.stderr.write("Failed: " + cmd + "\n" + err)
-            sys.exit(2)
-        if out.strip().lower() == "true":
-            common.cfgs[key] = True
-        if out.strip().lower() == "false":
-            common.cfgs[key] = False
-
-def get_current_br_pair(root):
-    """Find out local-remote branch pair of current checked out branch."""
-
-    cmd = "git branch -v -v"
+    cmd = ["git", "config", "--get-regexp", "^cmg\\."]
     (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
+    if err or code not in (0, 1): #exit code is 1 if nothing found
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
 
     for line in out.splitlines():
-        match = re.match(r"\*\s+(\S+)\s+\S+\s+\[(\S+?)(\]|:)\s+", line)
-        if match != None:
-            return (match.group(1), match.group(2))
+        (key, sep, value) = line.partition(" ")
+        key = key[4:]
+        if key not in common.cfgs:
+            print("Warning: unknown CMG configuration 'cmg." + key + "' in Git config file(s).")
+            continue
+        common.cfgs[key] = get_cfg_value(key, value, sep == "")
+
+def get_cfg_value(key, value, b_novalue):
+    """Check and convert a value of CMG configuration `key' read from Git config
+    file(s). `b_novalue' is True if there is only the key without `='."""
+
+    if isinstance(common.cfgs[key], bool):
+        if b_novalue or value.lower() in ("true", "yes", "on", "1"):
+            return True
+        if value.lower() in ("false", "no", "off", "0", ""):
+            return False
+        sys.stderr.write("Failed: cmg." + key + " should be true or false, but it's '" + value + "'.")
+        sys.exit(2)
+    elif isinstance(common.cfgs[key], int):
+        if value.isdigit():
+            return int(value)
+        sys.stderr.write("Failed: cmg." + key + " should be a number, but it's '" + value + "'.")
+        sys.exit(2)
+    elif key in common.POLICIES and value not in common.POLICIES[key] + ("",):
+        sys.stderr.write("Failed: cmg." + key + " should be " + " or ".join(common.POLICIES[key]) + \
+            ", but it's '" + value + "'.")
+        sys.exit(2)
+    else:
+        return value
+
+def get_current_br_pair(root):
+    """Find out local-remote branch pair of current checked out branch."""
+
+    refs = get_refs(root)
+    local = refs['current']
+    if local != "" and refs['heads'][local] != "":
+        return (local, refs['heads'][local])
     
     return ("", "")
        
 def get_remote_br_via_local(root, local):
     """Get remote-tracking branch using local branch name as a hint."""
 
-    cmd = "git branch -v -v"
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-
-    for line in out.splitlines():
-        match = re.match(r"\*?\s+" + local + r"\s+\S+\s+\[(\S+?)(\]|:)\s+", line)
-        if match != None:
-            return match.group(1)
-    
-    return ""
+    return get_refs(root)['heads'].get(local, "")
             
+def get_locals_via_remote(root, remote):
+    """Get all local branches which follow the remote-tracking branch. The
+    current branch, if it is one of them, comes first."""
+
+    refs = get_refs(root)
+    locals = []
+    for (local, upstream) in sorted(refs['heads'].items()):
+        if upstream == remote:
+            if local == refs['current']:
+                locals.insert(0, local)
+            else:
+                locals.append(local)
+    return locals
+
 def get_local_br_via_remote(root, remote):
     """Get (select if several) an local branch using remote-tracking branch name as a hint."""
     
@@ -210,25 +388,11 @@ def get_local_br_via_remote(root, remote):
     if remote[:7] != "origin/":
         return False
     
-    cmd = "git branch -v -v"
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-
-    locals = []
-    for line in out.splitlines():
-        pattern = r"(\*?)\s+(\S+)\s+\S+\s+\[" + remote + r"(\]|:)\s+"
-        match = re.match(pattern, line)
-        if match != None:
-            if match.group(1) == "*": #the current branch, the favorite
-                return match.group(2)
-            locals.append(match.group(2))
-
+    locals = get_locals_via_remote(root, remote)
     if len(locals) == 0:
         return ""
-    elif len(locals) == 1:
-        return locals[0]
+    elif len(locals) == 1 or locals[0] == get_refs(root)['current']:
+        return locals[0] #the current branch is the favorite
     else:
         print("Found multiple branch pairs you may mean:")
         i = 1
@@ -237,107 +401,199 @@ def get_local_br_via_remote(root, remote):
             i = i + 1
         print(str(i) + " quit")
         while True:
-            choice = input("? ")
+            choice = common.ask("? ")
             if choice == str(len(locals) + 1):
-                exit()
-            for j in len(locals):
+                sys.exit()
+            for j in range(1, len(locals) + 1):
                 if str(j) == choice:
                     return locals[j-1]
 
 def get_tag_annotation(root, tag):
     """Get content of tag annotation, which indicate the baseline configuation.""" 
 
-    cmd = "git tag -n10000 -l " + tag
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-    return re.sub(r"\S+\s+", "", out, 1)
+    object = get_object(root, "refs/tags/" + tag)
+    if object == None:
+        return ""
+
+    message = object[2].partition("\n\n")[2] #after the header lines
+    return re.sub(r"(^|\n)-----BEGIN (PGP|SSH) SIGNATURE-----.*", "\n", message, 1, re.S)
         
     
-def get_status(root):
-    """Show any abnormal status to deal with"""
+def get_porcelain_status(root):
+    """Get status of the working tree via `git status --porcelain=v2 -z', which
+    does not change among Git versions and languages.
     
-    cmd = "git status"
+    Return a dict: 'head' is current local branch ("" if not on a local branch),
+    'upstream' is its remote-tracking branch ("" if none), 'ahead' and 'behind'
+    are numbers of commits, 'changes' is a list of lines such as ' M path' or
+    '?? path' to show to user.
+    """
+
+    cmd = ["git"]
+    if common.cfgs['untrackedcache']:
+        cmd = cmd + ["-c", "core.untrackedCache=true"]
+    if common.cfgs['fsmonitor']:
+        cmd = cmd + ["-c", "core.fsmonitor=true"]
+    cmd = cmd + ["status", "--porcelain=v2", "-z", "--branch"]
     (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
+    if err or code != 0:
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
 
-    # "nothing to commit (working directory clean)"
-    match1 = re.search(r"nothing to commit \(working directory clean\)", out)
-    # "nothing to commit (create/copy files and use "git add" to track)"
-    match2 = re.search(r"nothing to commit \(create/copy files", out)
-    # "# Your branch is ahead of 'origin/st1' by 3 commits."
-    match3 = re.search(r"is ahead of", out)
-    # "# Your branch is behind 'origin/st1' by 1 commit, and can be fast-forwarded."
-    match4 = re.search(r"is behind", out)
-    # "# Your branch and 'origin/st1' have diverged."   
-    match5 = re.search(r"have diverged", out)
-
-    if (match1 != None or match2 != None) and \
-        (match3 == None and match4 == None and match5 == None):
-        return
+    status = {'head': "", 'upstream': "", 'ahead': 0, 'behind': 0, 'changes': []}
+    entries = out.split("\0")
+    i = 0
+    while i < len(entries):
+        entry = entries[i]
+        i = i + 1
+        if entry[:14] == "# branch.head ":
+            if entry[14:] != "(detached)":
+                status['head'] = entry[14:]
+        elif entry[:18] == "# branch.upstream ":
+            status['upstream'] = entry[18:]
+        elif entry[:12] == "# branch.ab ":
+            (ahead, behind) = entry[12:].split(" ")
+            status['ahead'] = int(ahead[1:])
+            status['behind'] = int(behind[1:])
+        elif entry[:2] == "1 ":
+            fields = entry.split(" ", 8)
+            status['changes'].append(fields[1].replace(".", " ") + " " + fields[8])
+        elif entry[:2] == "2 ": #renamed or copied, followed by the original path
+            fields = entry.split(" ", 9)
+            status['changes'].append(fields[1].replace(".", " ") + " " + entries[i] + " -> " + fields[9])
+            i = i + 1
+        elif entry[:2] == "u ":
+            fields = entry.split(" ", 10)
+            status['changes'].append(fields[1] + " " + fields[10])
+        elif entry[:2] == "? ":
+            status['changes'].append("?? " + entry[2:])
+
+    return status
+
+def format_status(status):
+    """Format what get_porcelain_status() returns, to show to user."""
+
+    if status['head'] == "":
+        lines = ["Not currently on any branch."]
+    elif status['upstream'] == "":
+        lines = ["On branch " + status['head'] + "."]
+    else:
+        lines = ["On branch " + status['head'] + ", following '" + status['upstream'] \
+            + "', ahead " + str(status['ahead']) + ", behind " + str(status['behind']) + "."]
+    lines.extend(status['changes'])
+    return "\n".join(lines) + "\n"
+
+def get_status(root):
+    """Show any abnormal status to deal with. Return a list of what found out:
+    'dirty', 'ahead' and/or 'behind'."""
+    
+    status = get_porcelain_status(root)
+
+    state = []
+    if len(status['changes']) != 0:
+        state.append("dirty")
+    if status['ahead'] != 0:
+        state.append("ahead")
+    if status['behind'] != 0:
+        state.append("behind")
+    if len(state) == 0:
+        return state
 
     print("Something to deal with:")
-    print(out)
+    print(format_status(status))
+    return state
 
 def create_new_tag(root, tag):
-    cmd = "git tag " + tag
+    cmd = ["git", "tag", tag]
     (out, err, code) = common.command(cmd, root)
+    drop_refs(root)
     if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
 
     print("Created new tag '" + tag + "'.")
 
+def check_new_tag(root, tag):
+    """Check if `tag' can be created, before any tag of the baseline is
+    created. Return True if it's an existing tag on HEAD already (such as when
+    the same freeze runs again), which is just used instead. Fail if it's an
+    existing tag on another revision."""
+
+    tags = get_refs(root)['tags']
+    if tag not in tags:
+        return False
+    if tags[tag] != get_current_revision(root):
+        sys.stderr.write("Failed: '" + tag + "' is an existing tag, but not on HEAD.")
+        sys.exit(2)
+
+    print("Tag '" + tag + "' already exists on HEAD, use it.")
+    return True
     
-def get_current_point(root, baseline):
-    """Get (create if have to) a tag or revision for HEAD.
+def get_tags_on_head(root):
+    """Get tags which point to HEAD (or contain HEAD, see is_on_tag())."""
+
+    if common.cfgs['tagcontains']:
+        cmd = ["git", "tag", "-l", "--contains", "HEAD"]
+        (out, err, code) = common.command(cmd, root)
+        if err:
+            sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+            sys.exit(2)
+
+        return [line.strip() for line in out.splitlines()]
+
+    revision = get_current_revision(root)
+    tags = get_refs(root)['tags']
+    return sorted([tag for tag in tags if tags[tag] == revision])
+
+def get_current_point(root, baseline, new_tags):
+    """Get a tag or revision for HEAD. If a new tag is needed, it's not created
+    here but appended to list `new_tags', as (tag, function, arguments) to
+    create it.
     
-    `baseline' is the tag name of container.
+    `baseline' is the tag name of container. What to use is asked, unless CMG
+    configuration `freezepoint' says, see get_policy() in common.py.
     """
     
-    cmd = "git tag -l --contains HEAD"
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-
-    tags = []
-    for line in out.splitlines():
-        tags.append(line.strip())
+    tags = get_tags_on_head(root)
     
     revision_now = get_current_revision(root)
-    print("1: use revision for this component: " + revision_now)
-    print("2: create a new tag for this component.")
-    print("3: create a new tag with baseline name '" + baseline + "'.")
-
-    i = 4
-    if len(tags) != 0:
-        for tag in tags:
-            print(str(i) + ": select existing tag '" + tag + "'.")
-            i = i + 1
+    policy = common.get_policy('freezepoint')
+    answer = {'revision': '1', 'baseline-tag': '3'}.get(policy, "")
+    if policy == "tag":
+        answer = '4' if len(tags) != 0 else '3' #an existing tag, or a new one
+    if answer == "":
+        print("1: use revision for this component: " + revision_now)
+        print("2: create a new tag for this component.")
+        print("3: create a new tag with baseline name '" + baseline + "'.")
+
+        i = 4
+        if len(tags) != 0:
+            for tag in tags:
+                print(str(i) + ": select existing tag '" + tag + "'.")
+                i = i + 1
 
     while True:
-        choice = input("? ")
+        choice = answer or common.ask("? ")
         if choice == '1':
+            print("Use revision '" + revision_now + "'.")
             return (revision_now, "revision")
         elif choice == '2':
             new_tag = ""
             while True:
-                new_tag = input("New tag name: ")
+                new_tag = common.ask("New tag name: ")
                 if new_tag.strip() != "":
                     break
-            create_new_tag(root, new_tag)
+            if not check_new_tag(root, new_tag):
+                new_tags.append((new_tag, create_new_tag, (root, new_tag)))
             return (new_tag, "tag")
         elif choice == '3':
-            create_new_tag(root, baseline)
+            if not check_new_tag(root, baseline):
+                new_tags.append((baseline, create_new_tag, (root, baseline)))
             return (baseline, "tag")
-        for j in len(tags):
-            if str(j+3) == choice:
-                print("Selected existing tag '" + tags[j-1] + "'.")
-                return (tags[j-1], "tag")
+        for j in range(len(tags)):
+            if str(j+4) == choice:
+                print("Selected existing tag '" + tags[j] + "'.")
+                return (tags[j], "tag")
         
 def remind_multi_local(root, remote):
     """Check if the remote-tracking branch has multiple local branches. Remind if so."""
@@ -348,29 +604,85 @@ def remind_multi_local(root, remote):
     if remote[:7] != "origin/":
         assert False, "It's not an remote-tracking branch."
     
-    cmd = "git branch -v -v"
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
-
-    lines = []
-    for line in out.splitlines():
-        pattern = r"(\*?)\s+(\S+)\s+\S+\s+\[" + remote + r"(\]|:)\s+"
-        match = re.match(pattern, line)
-        if match != None:
-            lines.append(line)
-
-    if len(lines) > 1:
+    locals = get_locals_via_remote(root, remote)
+    if len(locals) > 1:
         print("Reminder: remote-tracking branch '" + remote + "' has multiple local branches:")
         i = 1
-        for line in lines:
-            print(str(i) + ": " + line)
+        for local in locals:
+            print(str(i) + ": " + local)
             i = i + 1
     
     
-def init(root, url):
-    """Create a component's local repository via `git clone'."""
+def get_clone_options(config, component):
+    """Get options of partial clone and fetch of a component.
+    
+    They are `depth', `filter', `single_branch' and `narrow_fetch' in the
+    component's section of stream/baseline config, or CMG configurations
+    `depth', `filter', `singlebranch' and `narrowfetch' as default. Return a
+    dict: 'depth' is the number of commits of history to clone (0 for all),
+    'filter' is the filter of objects (such as 'blob:none', "" for all
+    objects), 'single_branch' is True if only to clone the branch/tag to
+    follow, 'narrow' is True if only to fetch the branch/tag/revision to follow
+    (see get_narrow_refspecs()), 'branch', 'tag' and 'revision' are the
+    branch, tag or revision to follow ("" if not).
+    """
+
+    options = {'depth': common.cfgs['depth'], 'filter': common.cfgs['filter'], \
+        'single_branch': common.cfgs['singlebranch'], 'narrow': common.cfgs['narrowfetch'], \
+        'branch': "", 'tag': "", 'revision': ""}
+
+    if config.has_option(component, "depth"):
+        depth = config.get(component, "depth")
+        if not depth.isdigit():
+            sys.stderr.write("Failed: bad format of stream/baseline config: ")
+            sys.stderr.write("'depth' option in '" + component + "' section should be a number.")
+            sys.exit(2)
+        options['depth'] = int(depth)
+    if config.has_option(component, "filter"):
+        options['filter'] = config.get(component, "filter")
+    if config.has_option(component, "single_branch"):
+        single_branch = config.get(component, "single_branch").lower()
+        if single_branch not in ("true", "false"):
+            sys.stderr.write("Failed: bad format of stream/baseline config: ")
+            sys.stderr.write("'single_branch' option in '" + component + "' section should be true or false.")
+            sys.exit(2)
+        options['single_branch'] = single_branch == "true"
+    if config.has_option(component, "narrow_fetch"):
+        narrow = config.get(component, "narrow_fetch").lower()
+        if narrow not in ("true", "false"):
+            sys.stderr.write("Failed: bad format of stream/baseline config: ")
+            sys.stderr.write("'narrow_fetch' option in '" + component + "' section should be true or false.")
+            sys.exit(2)
+        options['narrow'] = narrow == "true"
+
+    if config.has_option(component, "branch"):
+        branch = config.get(component, "branch")
+        if branch[:8] == "remotes/":
+            branch = branch[8:]
+        if branch[:7] == "origin/":
+            branch = branch[7:]
+        options['branch'] = branch
+    elif config.has_option(component, "tag"):
+        options['tag'] = config.get(component, "tag")
+    elif config.has_option(component, "revision"):
+        options['revision'] = config.get(component, "revision")
+
+    return options
+
+def is_partial(root, options):
+    """Check if the repository may not have all history/refs of remote, as a
+    partial clone."""
+
+    return options['depth'] > 0 or options['filter'] != "" or options['single_branch'] \
+        or os.path.isfile(os.path.join(root, ".git", "shallow"))
+
+def init(root, url, options):
+    """Create a component's local repository via `git clone'.
+    
+    `options' is the options of partial clone, see get_clone_options(). If CMG
+    configuration `cachedir' is set, objects are borrowed from the mirror of
+    `url' in the cache (see update_mirror()) instead of downloaded again.
+    """
 
     if not os.path.isdir(root):
         try:
@@ -382,47 +694,252 @@ def init(root, url):
             sys.stderr.write("Failed: can not to create folder " + root + ":\n" + str(sys.exc_info()[0]))
             sys.exit(2)
     
-    cmd = "git clone " + url + " " + root
+    cmd = ["git", "clone"]
+    if common.cfgs['cachedir'] != "":
+        cmd = cmd + ["--reference-if-able", update_mirror(url)]
+    if options['depth'] > 0:
+        cmd = cmd + ["--depth", str(options['depth'])]
+        if not options['single_branch']:
+            cmd = cmd + ["--no-single-branch"] #--depth implies --single-branch
+    if options['filter'] != "":
+        cmd = cmd + ["--filter=" + options['filter']]
+    if options['single_branch']:
+        cmd = cmd + ["--single-branch"]
+        if options['branch'] + options['tag'] != "":
+            cmd = cmd + ["-b", options['branch'] + options['tag']]
+    cmd = cmd + [url, root]
     (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
+    drop_refs(root)
+    if code != 0: #`git clone' shows its progress in stderr
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
     
     print("Success to initialize the component via clone.")
 
-def set_remote(root, url, pushurl):
-    """Set parameters of `origin' in Git config"""
+def set_remote(root, url, pushurl, options=None):
+    """Set parameters of `origin' in Git config.
+    
+    `options' is the options of partial clone, see get_clone_options(). If it
+    is single branch, only the branch/tag to follow will be fetched.
+    """
 
-    cmd = "git config remote.origin.url " + url
+    cmd = ["git", "config", "remote.origin.url", url]
     (out, err, code) = common.command(cmd, root)
     if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
 
-    fetch = "+refs/heads/*:refs/remotes/origin/*"
-    cmd = "git config remote.origin.fetch " + fetch
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
+    refspecs = get_refspecs(options)
+    if len(refspecs) != 0: #keep it as is for a revision on single branch
+        cmd = ["git", "config", "remote.origin.fetch", refspecs[0]]
+        (out, err, code) = common.command(cmd, root)
+        if err:
+            sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+            sys.exit(2)
 
-    cmd = "git config remote.origin.pushurl " + pushurl
+    cmd = ["git", "config", "remote.origin.pushurl", pushurl]
     (out, err, code) = common.command(cmd, root)
     if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
         
-def fetch(root):
-    """Call `git fetch origin'."""
+def get_refspecs(options):
+    """Get refspecs of `origin' to fetch. `options' is the options of partial
+    clone, see get_clone_options(). Return [] for a revision on single branch,
+    which means what Git config says."""
+
+    if options == None or not options['single_branch']:
+        return ["+refs/heads/*:refs/remotes/origin/*"]
+    elif options['branch'] != "":
+        return ["+refs/heads/" + options['branch'] + ":refs/remotes/origin/" + options['branch']]
+    elif options['tag'] != "":
+        return ["+refs/tags/" + options['tag'] + ":refs/tags/" + options['tag']]
+    return []
+
+def get_narrow_refspecs(root, options):
+    """Get refspecs to fetch only the branch/tag/revision to follow, when
+    option 'narrow' is True. `options' is the options of partial clone and
+    fetch, see get_clone_options().
+    
+    Return None if it's not narrow, or not sure what to fetch. Return [] if
+    nothing to fetch: a revision never changes once it's in local repository.
+    """
+
+    if options == None or not options['narrow']:
+        return None
+
+    if options['branch'] != "":
+        branch = options['branch']
+        upstream = get_refs(root)['heads'].get(branch, "") #it may be a local branch
+        if upstream[:7] == "origin/":
+            branch = upstream[7:]
+        return ["+refs/heads/" + branch + ":refs/remotes/origin/" + branch]
+    elif options['tag'] != "":
+        return ["refs/tags/" + options['tag'] + ":refs/tags/" + options['tag']]
+    elif options['revision'] != "" and is_revision(root, options['revision']):
+        return []
+    return None
+
+def is_fetched(gitdir, signature):
+    """Check whether `git fetch' with the same `signature' (what it fetches)
+    was done successfully in Git directory `gitdir' within CMG configuration
+    `fetchttl' seconds, by the stamp left by stamp_fetched()."""
+
+    if common.cfgs['fetchttl'] <= 0:
+        return False
+    stamp = os.path.join(gitdir, "cmg_fetched")
+    try:
+        with open(stamp, 'r') as f:
+            if f.read().strip() != signature:
+                return False
+        return time.time() - os.path.getmtime(stamp) < common.cfgs['fetchttl']
+    except:
+        return False
+
+def stamp_fetched(gitdir, signature):
+    """Record that `git fetch' with `signature' is done successfully just now
+    in Git directory `gitdir'. See is_fetched()."""
 
-    cmd = "git fetch origin"
+    if common.cfgs['fetchttl'] <= 0:
+        return
+    try:
+        with open(os.path.join(gitdir, "cmg_fetched"), 'w') as f:
+            f.write(signature + "\n")
+    except:
+        pass #a missing stamp just means to fetch next time
+
+def fetch(root, options=None, url="", b_force=False):
+    """Call `git fetch origin'.
+    
+    `options' is the options of partial clone and fetch, see get_clone_options().
+    If option 'narrow' is True, only the branch/tag/revision to follow is
+    fetched, without other tags. Option 'depth' is not passed, as `git fetch
+    --depth' cuts history back to the new tips, so that the local branch
+    diverges from its remote-tracking branch. A shallow clone keeps its
+    shallow boundary and fetches all new commits. If CMG configuration `cachedir' is set and
+    `url' is given, the mirror of `url' in the cache is updated (see
+    update_mirror()), and then fetch from the mirror instead of `origin'.
+    
+    Unless `b_force' is True, the fetch is skipped if the same fetch was done
+    within CMG configuration `fetchttl' seconds, see is_fetched().
+    """
+
+    refspecs = get_narrow_refspecs(root, options)
+    if refspecs == []:
+        return
+
+    cmd = ["git", "fetch"]
+    if refspecs != None:
+        cmd = cmd + ["--no-tags"]
+    b_mirror = url != "" and common.cfgs['cachedir'] != ""
+    if b_mirror and refspecs == None:
+        refspecs = get_refspecs(options)
+        if options == None or not options['single_branch']:
+            refspecs.append("refs/tags/*:refs/tags/*")
+    if refspecs == None:
+        refspecs = []
+
+    gitdir = os.path.join(root, ".git")
+    signature = common.cmdline(cmd + [url if b_mirror else "origin"] + refspecs)
+    if not b_force and is_fetched(gitdir, signature):
+        return
+
+    if b_mirror:
+        cmd = cmd + [update_mirror(url, b_force)] + refspecs
+    else:
+        cmd = cmd + ["origin"] + refspecs
     (out, err, code) = common.command(cmd, root)
+    drop_refs(root)
     if err and err[:4] != 'From':
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
+    stamp_fetched(gitdir, signature)
 
     #print("Success to fetch from origin.")
 
+_mirrors = {} #mirrors in cache already updated in this run, see update_mirror()
+#no gc/maintenance of a mirror ever drops objects, which components borrow via alternates
+MIRROR_CONFIG = ["-c", "gc.auto=0", "-c", "gc.pruneExpire=never", "-c", "maintenance.auto=false"]
+_mirror_locks = {} #lock of each mirror, when several components come from the same url
+_mirror_lock = threading.Lock()
+
+def update_mirror(url, b_force=False):
+    """Create or update (once per run) the bare mirror of `url' in the cache
+    directory, which is CMG configuration `cachedir'. Return the mirror's path.
+    Unless `b_force' is True, a mirror fetched within CMG configuration
+    `fetchttl' seconds is not fetched again, see is_fetched().
+    
+    Components from `url' in all workspaces on this machine share objects of
+    the mirror, so do not remove the cache directory while any of them exists.
+    For the same reason, automatic gc and maintenance are turned off in the
+    mirror (see MIRROR_CONFIG), so that objects which are no longer
+    reachable from the mirror's refs (such as of a deleted or rewritten
+    branch) are never pruned.
+    """
+
+    with _mirror_lock:
+        if url not in _mirror_locks:
+            _mirror_locks[url] = threading.Lock()
+        lock = _mirror_locks[url]
+
+    with lock:
+        if url in _mirrors:
+            return _mirrors[url]
+
+        cachedir = os.path.expanduser(common.cfgs['cachedir'])
+        name = re.sub(r"[^\w.-]+", "_", url).strip("_")[-48:]
+        mirror = os.path.join(cachedir, name + "-" + hashlib.sha1(url.encode('utf-8')).hexdigest()[:8] + ".git")
+
+        if not os.path.isdir(mirror):
+            if not os.path.isdir(cachedir):
+                try:
+                    os.makedirs(cachedir)
+                except:
+                    sys.stderr.write("Failed: can not to create folder " + cachedir + ":\n" + str(sys.exc_info()[0]))
+                    sys.exit(2)
+            cmd = ["git", "clone", "--mirror"] + MIRROR_CONFIG + [url, mirror]
+            (out, err, code) = common.command(cmd, cachedir)
+            if code != 0:
+                sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+                sys.exit(2)
+            stamp_fetched(mirror, url)
+            print("Success to create mirror '" + mirror + "' in cache.")
+        elif common.cfgs['online'] and (b_force or not is_fetched(mirror, url)):
+            cmd = ["git"] + MIRROR_CONFIG + ["fetch", "--prune", "origin"] #also for a mirror created before
+            (out, err, code) = common.command(cmd, mirror)
+            if code != 0:
+                sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+                sys.exit(2)
+            stamp_fetched(mirror, url)
+
+        _mirrors[url] = mirror
+        return mirror
+
+def fetch_missing(root, refspec, options):
+    """Fetch a tag or revision that a partial clone does not have yet.
+    
+    `refspec' is such as 'refs/tags/v1:refs/tags/v1' or a revision's SHA1.
+    `options' is the options of partial clone, see get_clone_options().
+    """
+
+    cmd = ["git", "fetch", "origin", refspec]
+    if options['depth'] > 0:
+        cmd = ["git", "fetch", "--depth", str(options['depth']), "origin", refspec]
+    (out, err, code) = common.command(cmd, root)
+    drop_refs(root)
+    if code == 0:
+        return
+
+    #remote repository may refuse to send a revision by SHA1, so fetch all history instead.
+    cmd = ["git", "fetch", "origin", "+refs/heads/*:refs/remotes/origin/*"]
+    if os.path.isfile(os.path.join(root, ".git", "shallow")):
+        cmd = ["git", "fetch", "--unshallow", "origin", "+refs/heads/*:refs/remotes/origin/*"]
+    (out, err, code) = common.command(cmd, root)
+    drop_refs(root)
+    if code != 0:
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+        sys.exit(2)
+
 def create_default_local_br(root, branch):
     """Create local branch which has the same (base) name of remote-tracking branch"""
     
@@ -432,10 +949,11 @@ def create_default_local_br(root, branch):
     elif branch[:7] == "origin/":
         local = branch[7:]
 
-    cmd = "git branch " + local + ' origin/' + local
+    cmd = ["git", "branch", local, "origin/" + local]
     (out, err, code) = common.command(cmd, root)
+    drop_refs(root)
     if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
 
     print("Success to create local branch " + local \
@@ -444,76 +962,117 @@ def create_default_local_br(root, branch):
     return local
 
 def cleanup_working_tree(root):
-    """Check and then clean up the working tree of the container / a component."""
-
-    cmd = "git status"
-    (out, err, code) = common.command(cmd, root)
-    if err:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
+    """Check and then clean up the working tree of the container / a component.
+    
+    What to do is asked, unless CMG configuration `dirty' says, see
+    get_policy() in common.py.
+    """
 
-    match = re.search(r"nothing to commit \(working directory clean\)", out)
-    if match != None:
+    status = get_porcelain_status(root)
+    if len(status['changes']) == 0:
         return
     
     print("You should cleanup working tree "\
         + "(via git reset/add/commit etc.) "\
-        + "before git checkout/merge/rebase/push:\n" + out\
+        + "before git checkout/merge/rebase/push:\n" + format_status(status)\
         + "(Hint: you may want to add them to .gitignore?)")
 
-    match = re.search(r"# Not currently on any branch.", out)
-    if match == None:
-        print("1: add and commit all\n2: clean and reset all\n" \
-            + "3: handled clean up manually, pls continue\n4: quit")
+    policy = common.get_policy('dirty')
+    if policy == "abort":
+        sys.stderr.write("Failed: the working tree is not clean. (See option --dirty.)")
+        sys.exit(2)
+    elif policy == "stash":
+        stash_working_tree(root)
+        return
+    elif policy == "commit" and status['head'] == "":
+        sys.stderr.write("Failed: can not commit modifications as it's not on a local branch. (See option --dirty.)")
+        sys.exit(2)
+
+    if status['head'] != "":
+        answer = {'commit': '1', 'reset': '2'}.get(policy, "")
+        if answer == "":
+            print("1: add and commit all\n2: clean and reset all\n" \
+                + "3: handled clean up manually, pls continue\n4: quit")
         while True:
-            choice = input("? ")
+            choice = answer or common.ask("? ")
             if choice == '4':
                 sys.exit(2)
             elif choice == '3':
                 break
             elif choice == '2':
-                cmd = "git clean -f ."
-                (out, err, code) = common.command(cmd, root)
-                if err:
-                    sys.stderr.write("Failed: " + cmd + "\n" + err)
-                    continue
-                cmd = "git reset --hard HEAD"
-                (out, err, code) = common.command(cmd, root)
-                if err:
-                    sys.stderr.write("Failed: " + cmd + "\n" + err)
-                    continue
-                break
+                if reset_working_tree(root, ["git", "clean", "-f", "."], answer != ""):
+                    break
             elif choice == '1':
-                if common.cfgs['addnewfile']:
-                    cmd = "git add ."
-                    (out, err, code) = common.command(cmd, root)
-                    if err:
-                        sys.stderr.write("Failed: " + cmd + "\n" + err)
-                        continue
-                cmd = "git commit -a"
-                common.command_free(cmd, root)
-                break
+                if commit_working_tree(root, answer != ""):
+                    break
     else:
-        print("1: clean and reset all\n2: handled clean up manually, "\
-            + "pls continue\n3: quit")
+        answer = {'reset': '1'}.get(policy, "")
+        if answer == "":
+            print("1: clean and reset all\n2: handled clean up manually, "\
+                + "pls continue\n3: quit")
         while True:
-            choice = input("? ")
+            choice = answer or common.ask("? ")
             if choice == '3':
                 sys.exit(2)
             elif choice == '2':
                 break
             elif choice == '1':
-                cmd = "git clean -d -f ."
-                (out, err, code) = common.command(cmd, root)
-                if err:
-                    sys.stderr.write("Failed: " + cmd + "\n" + err)
-                    continue
-                cmd = "git reset --hard HEAD"
-                (out, err, code) = common.command(cmd, root)
-                if err:
-                    sys.stderr.write("Failed: " + cmd + "\n" + err)
-                    continue
-                break
+                if reset_working_tree(root, ["git", "clean", "-d", "-f", "."], answer != ""):
+                    break
+
+def reset_working_tree(root, clean, b_policy):
+    """Remove untracked files via command `clean', and reset the working tree.
+    Return False if failed and user may choose again, or fail if `b_policy'
+    is True (it was not asked)."""
+
+    for cmd in (clean, ["git", "reset", "--hard", "HEAD"]):
+        (out, err, code) = common.command(cmd, root)
+        if err:
+            sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+            if b_policy:
+                sys.exit(2)
+            return False
+    print("Success to clean and reset the working tree.")
+    return True
+
+def commit_working_tree(root, b_policy):
+    """Add (if CMG configuration `addnewfile' is True) and commit all
+    modifications. If `b_policy' is True (it was not asked), commit with a
+    message instead of opening an editor, and fail if anything fails. Return
+    False if failed and user may choose again."""
+
+    if common.cfgs['addnewfile']:
+        cmd = ["git", "add", "."]
+        (out, err, code) = common.command(cmd, root)
+        if err:
+            sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+            if b_policy:
+                sys.exit(2)
+            return False
+    if b_policy:
+        cmd = ["git", "commit", "-a", "-m", "Commit local modifications before CMG goes on."]
+        (out, err, code) = common.command(cmd, root)
+        drop_refs(root)
+        if code != 0:
+            sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + out + err)
+            sys.exit(2)
+        print("Success to commit local modifications.")
+    else:
+        cmd = ["git", "commit", "-a"]
+        common.command_free(cmd, root)
+        drop_refs(root)
+    return True
+
+def stash_working_tree(root):
+    """Save all modifications (including untracked files) into `git stash'."""
+
+    cmd = ["git", "stash", "push", "--include-untracked", "-m", "Saved by CMG before it goes on."]
+    (out, err, code) = common.command(cmd, root)
+    drop_refs(root)
+    if code != 0:
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+        sys.exit(2)
+    print("Success to stash local modifications. See `git stash list'.")
     
 def checkout(root, point, type):
     """Checkout a branch or tag of the container / a component.
@@ -521,11 +1080,12 @@ def checkout(root, point, type):
     `point' is the branch or tag's name. The value of `type' should be 'branch' or 'tag' or 'revision'.
     """
 
-    cmd = "git checkout " + point
+    cmd = ["git", "checkout", point]
     (out, err, code) = common.command(cmd, root)
+    drop_refs(root)
     if err and err[:8] != "Switched" and err[:7] != "Already" \
         and err[:5] != "Note:" and err[:4] != "HEAD" and err[:8] != "Previous":
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
     else:
         print("Success to checkout " + type + " '" + point + "'.")
@@ -534,18 +1094,21 @@ def rebase(root, remote):
     """Run `git rebase' to rebase current local branch based on the tip of remote-tracking branch"""
 
     print("Start rebase from remote-tracking branch " + remote +"...")
-    cmd = "git rebase " + remote
+    cmd = ["git", "rebase", remote]
     (out, err, code) = common.command(cmd, root)
+    drop_refs(root)
 
     match1 = re.search(r"fatal: ", err)
     match2 = re.search(r"When you have resolved this problem run ", out)
     match3 = re.search(r"Current branch \S+ is up to date.", out)
-    if match1 != None or match2 != None:
-        print("Failed to do rebase fullly automatically: " + cmd + "\n" + out + err)
+    if code != 0 or match1 != None or match2 != None:
+        print("Failed to do rebase fullly automatically: " + common.cmdline(cmd) + "\n" + out + err)
+        if handle_conflict(root, ["git", "rebase", "--abort"]):
+            return
         print("1: fixed the merge conflict and *finished all* for " \
             + "this rebase, pls continue\n2: quit")
         while True:
-            choice = input("? ")
+            choice = common.ask("? ")
             if choice == '2':
                 sys.exit()
             elif choice == '1':
@@ -555,22 +1118,43 @@ def rebase(root, remote):
     else:
         print("Success to rebase fully automatically.")
 
+def handle_conflict(root, abort):
+    """Follow CMG configuration `conflict' (see get_policy() in common.py) when
+    rebase/merge fails: run command `abort' to give up the rebase/merge, and
+    then fail if it's 'abort', or return True if it's 'skip'. Return False if
+    user should be asked."""
+
+    policy = common.get_policy('conflict')
+    if policy == "":
+        return False
+
+    (out, err, code) = common.command(abort, root) #fails if the rebase/merge did not even start
+    drop_refs(root)
+    if policy == "abort":
+        sys.stderr.write("Failed: gave up the rebase/merge via " + common.cmdline(abort) + ". (See option --conflict.)")
+        sys.exit(2)
+    print("Skipped: gave up the rebase/merge via " + common.cmdline(abort) + ", the branch stays as before.")
+    return True
+
 def merge(root, remote):
     """Run `git merge' to merge from remote-tracking branch to current local branch."""
 
     print("Start merge from remote-tracking branch '" + remote + "'...")
-    cmd = "git merge " + remote
+    cmd = ["git", "merge", remote]
     (out, err, code) = common.command(cmd, root)
+    drop_refs(root)
     
     match1 = re.search(r"fatal: ", err)
     match2 = re.search(r"Automatic merge failed", out)
-    match3 = re.search(r"Already up-to-date", out)
-    if match1 != None or match2 != None:
-        print("Failed to do merge fully automatically: " + cmd + "\n" + out + err)
+    match3 = re.search(r"Already up.to.date", out)
+    if code != 0 or match1 != None or match2 != None:
+        print("Failed to do merge fully automatically: " + common.cmdline(cmd) + "\n" + out + err)
+        if handle_conflict(root, ["git", "merge", "--abort"]):
+            return
         print("1: fixed the merge conflict and *committed*, " \
             + "pls continue\n2: quit")
         while True:
-            choice = input("? ")
+            choice = common.ask("? ")
             if choice == '2':
                 sys.exit(2)
             elif choice == '1':
@@ -590,17 +1174,20 @@ def push(root, remote):
         
     print("Start push to branch '" + remote[7:] + "' in remote repository...")
 
-    cmd = "git push origin HEAD:" + remote[7:]
+    cmd = ["git", "push", "origin", "HEAD:" + remote[7:]]
     (out, err, code) = common.command(cmd, root)
+    drop_refs(root)
 
     match1 = re.search(r"fatal: ", err)
     match2 = re.search(r"error: ", err)
     match3 = re.search(r"Everything up-to-date", err)
     if match1 != None or match2 != None:
-        print("Failed to push: " + cmd + "\n" + out + err)
+        print("Failed to push: " + common.cmdline(cmd) + "\n" + out + err)
+        if not common.cfgs['interactive']:
+            sys.exit(2)
         print("1: handled manually, pls continue\n2: quit")
         while True:
-            choice = input("? ")
+            choice = common.ask("? ")
             if choice == '2':
                 sys.exit(2)
             elif choice == '1':
@@ -619,17 +1206,19 @@ def push_tag(root, tag):
     
     print("Start push tag '" + tag + "' to remote repository...")
 
-    cmd = "git push origin tag " + tag
+    cmd = ["git", "push", "origin", "tag", tag]
     (out, err, code) = common.command(cmd, root)
     
     match1 = re.search(r"fatal: ", err)
     match2 = re.search(r"error: ", err)
     match3 = re.search(r"Everything up-to-date", err)
     if match1 != None or match2 != None:
-        print("Failed to push tag: " + cmd + "\n" + out + err)
+        print("Failed to push tag: " + common.cmdline(cmd) + "\n" + out + err)
+        if not common.cfgs['interactive']:
+            sys.exit(2)
         print("1: handled manually, pls continue\n2: quit")
         while True:
-            choice = input("? ")
+            choice = common.ask("? ")
             if choice == '2':
                 sys.exit(2)
             elif choice == '1':
@@ -641,12 +1230,13 @@ def push_tag(root, tag):
 
 def create_tag(root, tag, bl_cfg_fl_name):
 
-    cmd = "git tag -F " + bl_cfg_fl_name + " " + tag
+    cmd = ["git", "tag", "-F", bl_cfg_fl_name, tag]
     (out, err, code) = common.command(cmd, root)
+    drop_refs(root)
     
     match = re.search(r"fatal: ", err)
     if match != None:
-        sys.stderr.write("Failed to create tag: " + cmd + "\n" + out + err)
+        sys.stderr.write("Failed to create tag: " + common.cmdline(cmd) + "\n" + out + err)
         sys.exit(2)
 
     print("Success to create tag '" + tag + "'.")
@@ -664,6 +1254,16 @@ def download(root, config, component):
     `component' is the name of the component.
     """
 
+    download_fetch(root, config, component)
+    download_apply(root, config, component)
+
+def download_fetch(root, config, component):
+    """The first stage of download(): clone or fetch a component from Git
+    remote repository to Git local repository, without touching the working
+    tree. It takes a slot of the remote's server, see get_host_slot() in
+    common.py.
+    """
+
     root = os.path.join(root, component) #now it's the root of this component.
     print("---- " + root)
 
@@ -673,16 +1273,26 @@ def download(root, config, component):
         sys.exit(2)
     url = config.get(component, "url")
 
-    if not os.path.isdir(os.path.join(root, ".git")):
-        init(root, url)
+    options = get_clone_options(config, component)
+    with common.get_host_slot(url):
+        if not os.path.isdir(os.path.join(root, ".git")):
+            init(root, url, options)
     
-    pushurl = url
-    if config.has_option(component, "pushurl"):
-        pushurl = config.get(component, "pushurl")
-    set_remote(root, url, pushurl) #remote settings in local repository
+        pushurl = url
+        if config.has_option(component, "pushurl"):
+            pushurl = config.get(component, "pushurl")
+        set_remote(root, url, pushurl, options) #remote settings in local repository
    
-    if common.cfgs['online']:
-        fetch(root)
+        if common.cfgs['online']:
+            fetch(root, options, url)
+
+def download_apply(root, config, component):
+    """The second stage of download(): bring the working tree of a component
+    to its branch/tag/revision, after download_fetch()."""
+
+    root = os.path.join(root, component) #now it's the root of this component.
+    options = get_clone_options(config, component)
+    url = config.get(component, "url")
 
     local = remote = tag = revision = ""
     if config.has_option(component, "branch"):
@@ -708,6 +1318,9 @@ def download(root, config, component):
             sys.exit(2)
     elif config.has_option(component, "tag"):
         point = config.get(component, "tag")
+        if not is_tag(root, point) and common.cfgs['online'] and is_partial(root, options):
+            with common.get_host_slot(url):
+                fetch_missing(root, "refs/tags/" + point + ":refs/tags/" + point, options)
         if is_tag(root, point):
             tag = point
         else:
@@ -715,6 +1328,9 @@ def download(root, config, component):
             sys.exit(2)
     elif config.has_option(component, "revision"):
         point = config.get(component, "revision")
+        if not is_revision(root, point) and common.cfgs['online'] and is_partial(root, options):
+            with common.get_host_slot(url):
+                fetch_missing(root, point, options)
         if is_revision(root, point):
             revision = point
         else:
@@ -741,7 +1357,8 @@ def status(root, config, component):
     """Show status of a component.
     
     `root' is the root of container. `config' stores the stream/baseline config.
-    `component' is the name of the component.
+    `component' is the name of the component. Return a list of what found out:
+    'missing', 'off-branch', 'dirty', 'ahead' and/or 'behind'.
     """
 
     root = os.path.join(root, component) #now it's the root of this component.
@@ -755,16 +1372,18 @@ def status(root, config, component):
 
     if not os.path.isdir(os.path.join(root, ".git")):
         print("Warning: this component does not exist yet.")
-        return
+        return ["missing"]
     
     pushurl = url
     if config.has_option(component, "pushurl"):
         pushurl = config.get(component, "pushurl")
-    set_remote(root, url, pushurl) #remote settings in local repository
+    options = get_clone_options(config, component)
+    set_remote(root, url, pushurl, options) #remote settings in local repository
    
     if common.cfgs['online']:
-        fetch(root)
+        fetch(root, options, url)
 
+    state = []
     local = remote = tag = revision = ""
     if config.has_option(component, "branch"):
         point = config.get(component, "branch")
@@ -774,6 +1393,7 @@ def status(root, config, component):
             if remote == "":
                 print("Warning: can not find local branch "\
                     + local + "'s remote-tracking branch\n")
+                state.append("off-branch")
         elif is_local_br_to_create(root, point):
             local = create_default_local_br(root, point)
             remote = "origin/" + local
@@ -785,18 +1405,23 @@ def status(root, config, component):
         else:
             print("Warning: '" + point + "' is not a local branch or "\
                 + "remote-tracking branch.")
+            state.append("off-branch")
     elif config.has_option(component, "tag"):
         point = config.get(component, "tag")
+        if not is_tag(root, point) and common.cfgs['online'] and is_partial(root, options):
+            fetch_missing(root, "refs/tags/" + point + ":refs/tags/" + point, options)
         if is_tag(root, point):
             tag = point
         else:
             print("Warning: '" + point + "' is not a tag.")
+            state.append("off-branch")
     elif config.has_option(component, "revision"):
         point = config.get(component, "revision")
         if is_revision(root, point):
             revision = point
         else:
             print("Warning: '" + point + "' is not a revision.")
+            state.append("off-branch")
     else:
         sys.stderr.write("Failed: bad format of stream/baseline config: ")
         sys.stderr.write("No 'branch' or 'tag' or 'revision' option in '" + component + "' section.")
@@ -809,24 +1434,28 @@ def status(root, config, component):
                 + local + "' to follow remote-tracking branch '" + remote +"', "\
                 + "but currently it's not on a local branch " \
                 + "that follow a remote-tracking branch.")
+            state.append("off-branch")
         elif local_now != local:
             print("Warning: it's expected to be on local branch '"\
                 + local + "' to follow remote-tracking branch '" + remote +"', "\
                 + "but currently it's on local branch '" + local_now \
                 + "' that follow remote-tracking branch '" + remote_now + "'.")
+            state.append("off-branch")
         remind_multi_local(root, remote)
         
     elif tag != "": # to check if HEAD on the given tag or not
         if not is_on_tag(root, tag):
             print("Warning: it's expected to be on tag '" + tag \
                 + "', but currently it's not.")
+            state.append("off-branch")
 
     elif revision != "": # to check if HEAD on the given revision or not
         if not is_on_revision(root, revision):
             print("Warning: it's expected to be on revision '" + revision \
                 + "', but currently it's not.")
+            state.append("off-branch")
                 
-    get_status(root)
+    return state + get_status(root)
 
 def upload(root, config, component):
     """Upload/deliver a component's local modifications (in working tree and local repository) to its remote repository.
@@ -851,9 +1480,10 @@ def upload(root, config, component):
     pushurl = url
     if config.has_option(component, "pushurl"):
         pushurl = config.get(component, "pushurl")
-    set_remote(root, url, pushurl) #remote settings in local repository
+    options = get_clone_options(config, component)
+    set_remote(root, url, pushurl, options) #remote settings in local repository
 
-    fetch(root)
+    fetch(root, options, url, True) #never push upon stale remote-tracking branches
     
     local = remote = tag = revision = ""
     if config.has_option(component, "branch"):
@@ -924,8 +1554,9 @@ def upload(root, config, component):
         print("Warning: " + revision + " will not be pushed to server side as it's not a branch or tag but revision. " + \
             "Pls ensure it's on server side manually.")
 
-def freeze(root, config_now, config_ref, component, baseline):
-    """Find out tag (create tag if neccessary) or revision for a component."""
+def freeze(root, config_now, config_ref, component, baseline, new_tags):
+    """Find out tag or revision for a component. Tags to create are appended
+    to list `new_tags', see get_current_point()."""
 
     root = os.path.join(root, component) #now it's the root of this component.
     print("---- " + root)
@@ -943,23 +1574,27 @@ def freeze(root, config_now, config_ref, component, baseline):
     pushurl = url
     if config_now.has_option(component, "pushurl"):
         pushurl = config_now.get(component, "pushurl")
-    set_remote(root, url, pushurl) #remote settings in local repository
+    options = get_clone_options(config_now, component)
+    set_remote(root, url, pushurl, options) #remote settings in local repository
 
     if common.cfgs['online']:
-        fetch(root)
+        with common.get_host_slot(url):
+            fetch(root, options, url)
 
     cleanup_working_tree(root)
     
     point_now = type_now = "" #type_now could be "tag" or "revision"
     if config_ref.has_option(component, "tag"):
         tag_ref = config_ref.get(component, "tag")
+        if not is_tag(root, tag_ref) and common.cfgs['online'] and is_partial(root, options):
+            fetch_missing(root, "refs/tags/" + tag_ref + ":refs/tags/" + tag_ref, options)
         if is_on_tag(root, tag_ref):
             print("Still on previous tag '" + tag_ref + "'.")
             point_now = tag_ref
             type_now = "tag"
         else:
             print("No longer on previous tag '" + tag_ref + "'.")
-            (point_now, type_now) = get_current_point(root, baseline)
+            (point_now, type_now) = get_current_point(root, baseline, new_tags)
     elif config_ref.has_option(component, "revision"):
         revision_ref = config_ref.get(component, "revision")
         if is_on_revision(root, revision_ref):
@@ -972,7 +1607,7 @@ def freeze(root, config_now, config_ref, component, baseline):
             type_now = "revision"
             print("Move to revision '" + point_now + "'.")
     else:
-        (point_now, type_now) = get_current_point(root, baseline)
+        (point_now, type_now) = get_current_point(root, baseline, new_tags)
 
     config_now.set(component, type_now, point_now)
     if type_now == "tag" and config_now.has_option(component, "revision"):
@@ -1,11 +1,90 @@
 import sys
 import os
 import re
+import io
+import shutil
+import json
+import time
+import pathlib
+import threading
+import xml.etree.ElementTree as ElementTree
+try:
+    import sqlite3
+except ImportError: #Python built without sqlite3
+    sqlite3 = None
 
 from cmglib import common
 
-def init(root, url, revision):
-    """Create a component's working copy via `svn co'."""
+WC_DB_FORMATS = (29, 31) #formats of .svn/wc.db of SVN 1.7 and 1.8 ~ 1.14, which read_wc_db() knows
+DEPTHS = ("empty", "files", "immediates", "infinity") #values of option `depth' of a component
+EXPORT_MARKER = ".cmg-export" #file in an exported component, to record where it comes from, see export()
+
+_infos = {} #entries of working copies found out in advance, see prepare_status()
+_changes = {} #changes of working copies found out in advance, see prepare_status()
+_tips = None #youngest revision of each repository, and more, see get_youngests()
+_tips_lock = threading.Lock()
+
+def get_sparse_options(config, component):
+    """Get (depth, includes) of a component from its options in stream/baseline
+    config: `depth' (see DEPTHS) of the working copy, "" if not given, and
+    `include', a list of paths checked out fully besides that depth. With
+    `include', the depth is 'empty' if not given."""
+
+    depth = ""
+    if config.has_option(component, "depth"):
+        depth = config.get(component, "depth").strip().lower()
+    includes = []
+    if config.has_option(component, "include"):
+        includes = [path.strip() for path in config.get(component, "include").split(",") if path.strip() != ""]
+
+    if depth not in DEPTHS + ("",):
+        sys.stderr.write("Failed: bad format of stream/baseline config: ")
+        sys.stderr.write("'depth' of '" + component + "' should be " + ", ".join(DEPTHS) + ".")
+        sys.exit(2)
+    if depth == "" and len(includes) != 0:
+        depth = "empty"
+    return (depth, includes)
+
+def include(root, revision, includes):
+    """Check out paths `includes' (the ones not in the working copy yet) fully
+    in a sparse working copy, via one `svn update --set-depth infinity'."""
+
+    paths = [path for path in includes if not os.path.exists(os.path.join(root, path))]
+    if len(paths) == 0:
+        return
+
+    drop_cache(root)
+    cmd = ["svn", "update", "--parents", "--set-depth", "infinity"]
+    if revision != "":
+        cmd = cmd + ["-r", revision]
+    cmd = cmd + paths
+    (out, err, code) = common.command(cmd, root)
+    if err or code != 0:
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+        sys.exit(2)
+
+    print("Success to check out " + ", ".join(paths) + ".")
+
+def set_depth(root, depth):
+    """Change the depth of a working copy to `depth' via `svn update
+    --set-depth', if it's not. Paths in option `include' are checked out again
+    by include() afterwards, if a smaller depth drops them."""
+
+    if depth == "" or get_entry(root, "").get('depth', depth) in (depth, ""):
+        return
+
+    drop_cache(root)
+    cmd = ["svn", "update", "--set-depth", depth]
+    (out, err, code) = common.command(cmd, root)
+    if err or code != 0:
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+        sys.exit(2)
+
+    print("Success to set depth of the working copy to " + depth + ".")
+
+def init(root, url, revision, depth="", includes=[]):
+    """Create a component's working copy via `svn co', of `depth' and with
+    `includes' if given, see get_sparse_options()."""
 
     if not os.path.isdir(root):
         try:
@@ -17,119 +96,626 @@ def init(root, url, revision):
             sys.stderr.write("Failed: can not to create folder '" + root + "':\n" + str(sys.exc_info()[0]))
             sys.exit(2)
     
-    cmd = "svn co " + url + " " + root
+    cmd = ["svn", "co", url, root]
     if revision != "":
-        cmd = cmd + " -r " + revision
+        cmd = cmd + ["-r", revision]
+    if depth != "":
+        cmd = cmd + ["--depth", depth]
     (out, err, code) = common.command(cmd, root)
     if err or code != 0:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
     
     print("Success to initialize the component via 'svn co'.")
+    include(root, revision, includes)
 
+def is_export(config, component):
+    """Return True if a component is to be exported via `svn export' instead
+    of checked out, as its option `export' says. Only a tag or a given
+    revision, which is never modified, could be exported."""
 
-def get_status(root):
-    """Show any abnormal status to deal with. Return True if anything be found out."""
-    
-    cmd = "svn status"
+    if not config.has_option(component, "export"):
+        return False
+    export = config.get(component, "export").lower()
+    if export not in ("true", "false"):
+        sys.stderr.write("Failed: bad format of stream/baseline config: ")
+        sys.stderr.write("'export' option in '" + component + "' section should be true or false.")
+        sys.exit(2)
+    if export == "false":
+        return False
+
+    if not config.has_option(component, "revision") and \
+        (config.has_option(component, "branch_url") or not config.has_option(component, "tag")):
+        sys.stderr.write("Failed: bad format of stream/baseline config: ")
+        sys.stderr.write("'export' option in '" + component + "' section needs 'tags_url' & 'tag'" + \
+            " options, or 'branch_url' & 'revision' options.")
+        sys.exit(2)
+    return True
+
+def read_export(root):
+    """Read marker EXPORT_MARKER of an exported component. Return (url,
+    revision) it's exported from, or None if it's not exported."""
+
+    try:
+        f = open(os.path.join(root, EXPORT_MARKER), 'r')
+    except (IOError, OSError):
+        return None
+
+    line = f.readline().strip()
+    f.close()
+
+    (url, sep, revision) = line.rpartition("@")
+    if sep == "" or url == "":
+        return None
+    return (url, revision)
+
+def remove_export(root):
+    """Remove an exported component, or what's left by an interrupted export().
+    Components in its directory are removed too, so it's up to the caller to
+    make sure there is none, see download()."""
+
+    try:
+        shutil.rmtree(root)
+    except (IOError, OSError):
+        sys.stderr.write("Failed: can not remove tree '" + root + "'.")
+        sys.exit(2)
+
+def export(root, url, revision, depth=""):
+    """Export a component via `svn export', without metadata of a working
+    copy, and record url@revision in marker EXPORT_MARKER. It's exported
+    beside and then renamed to `root', so that an interrupted export never
+    looks like a whole one. If `revision' is not given, the youngest revision
+    of `url' is found out via `svn info --xml' first, and then exported."""
+
+    temp = root + EXPORT_MARKER
+    if os.path.exists(temp):
+        remove_export(temp)
+    parent = os.path.dirname(temp)
+    if not os.path.isdir(parent):
+        try:
+            os.makedirs(parent)
+        except OSError:
+            sys.stderr.write("Failed: can not create directory '" + parent + "'.")
+            sys.exit(2)
+
+    if revision == "":
+        revision = get_entry(parent, url)['revision']
+        if revision == "":
+            sys.stderr.write("Failed: can not find out the revision of '" + url + "' to export.")
+            sys.exit(2)
+
+    cmd = ["svn", "export", url, temp, "-r", revision]
+    if depth != "":
+        cmd = cmd + ["--depth", depth]
+    (out, err, code) = common.command(cmd, parent)
+    if err or code != 0:
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+        sys.exit(2)
+
+    try:
+        f = open(os.path.join(temp, EXPORT_MARKER), 'w')
+        f.write(url + "@" + revision + "\n")
+        f.close()
+        if os.path.exists(root):
+            remove_export(root)
+        os.rename(temp, root)
+    except (IOError, OSError):
+        sys.stderr.write("Failed: can not move exported '" + temp + "' to '" + root + "'.")
+        sys.exit(2)
+
+    print("Success to export the component via 'svn export', at revision " + revision + ".")
+
+
+def parse_status_xml(out):
+    """Parse output of `svn status --xml'. Return a list of (target, change,
+    path) of each item which is not clean, such as ('.', 'modified', 'a.c')."""
+
+    changes = []
+    target = ""
+    try:
+        for (event, element) in ElementTree.iterparse(io.BytesIO(out.encode('utf-8')), ("start", "end")):
+            if event == "start" and element.tag == "target":
+                target = element.get("path", "")
+            elif event == "end" and element.tag == "entry":
+                status = element.find("wc-status")
+                if status == None:
+                    continue
+                change = status.get("item", "none")
+                if change in ("normal", "none", "external"):
+                    change = ""
+                    if status.get("props", "none") in ("modified", "conflicted"):
+                        change = "properties " + status.get("props")
+                if status.get("tree-conflicted") == "true":
+                    change = "tree-conflicted"
+                if change != "":
+                    changes.append((target, change, element.get("path", "")))
+                element.clear()
+    except ElementTree.ParseError:
+        pass #partial output of a failed command
+    return changes
+
+def get_changes(root):
+    """Get a list of (change, path) of items which are not clean in a working
+    copy, via `svn status --xml' (unless found out in advance)."""
+
+    changes = _changes.pop(root, None)
+    if changes != None:
+        return changes
+
+    cmd = ["svn", "status", "--xml"]
     (out, err, code) = common.command(cmd, root)
     if err or code != 0:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
 
-    if out.strip() != "":
+    return [(change, path) for (target, change, path) in parse_status_xml(out)]
+
+def get_status(root):
+    """Show any abnormal status to deal with. Return True if anything be found out."""
+    
+    changes = get_changes(root)
+    if len(changes) != 0:
         print("Something to deal with:")
-        print(out)
+        for (change, path) in changes:
+            print(change.ljust(12) + " " + path)
         return True
     
     return False
         
-def switch(root, url, revision):
-    """Call `svn switch' to switch/update workspace to url -r revision"""
+def handle_dirty(root):
+    """Ask what to do with modification(s) in the working copy, unless CMG
+    configuration `dirty' says (see get_policy() in common.py): 'abort' fails,
+    'reset' reverts them, while 'stash' and 'commit' are not supported for
+    SVN."""
+
+    drop_cache(root)
+    policy = common.get_policy('dirty')
+    if policy == "abort":
+        sys.stderr.write("Failed: the working copy is not clean. (See option --dirty.)")
+        sys.exit(2)
+    elif policy == "reset":
+        cmd = ["svn", "revert", "-R", "."]
+        (out, err, code) = common.command(cmd, root)
+        if err or code != 0:
+            sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+            sys.exit(2)
+        print("Success to revert local modifications.")
+        return
+    elif policy != "":
+        sys.stderr.write("Failed: --dirty=" + policy + " is not supported for a component under SVN.")
+        sys.exit(2)
+
+    print("1: handled clean up manually, pls continue\n2: quit")
+    while True:
+        choice = common.ask("? ")
+        if choice == '2':
+            sys.exit(2)
+        elif choice == '1':
+            break
+
+def switch(root, url, revision, depth="", includes=[]):
+    """Call `svn switch' to switch/update workspace to url -r revision. It
+    keeps the depth of the working copy, or changes it to `depth' and checks
+    out `includes' if given, see get_sparse_options()."""
    
-    cmd = "svn switch " + url
+    set_depth(root, depth)
+    drop_cache(root)
+    cmd = ["svn", "switch", "--non-interactive", "--accept", "postpone", url]
     if revision != "":
-        cmd = cmd + " -r " + revision
+        cmd = cmd + ["-r", revision]
 
-    code = common.command_free(cmd, root)
+    (out, err, code) = common.command(cmd, root)
     if code != 0:
-        sys.stderr.write("Failed: " + cmd)
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+        sys.exit(2)
+
+    if re.search(r"^[ADUCGER ]{0,3}C ", out, re.M) != None: #`C' in any column of a conflicted item
+        print(out.rstrip())
+        handle_conflict(root)
+    else:
+        print("Success to update/switch the working tree.")
+    include(root, revision, includes)
+
+def handle_conflict(root):
+    """Follow CMG configuration `conflict' (see get_policy() in common.py) when
+    `svn switch' leaves conflicts postponed: fail if it's 'abort', or go on
+    with them if it's 'skip'. Otherwise ask user to resolve them."""
+
+    drop_cache(root)
+    policy = common.get_policy('conflict')
+    if policy == "abort":
+        sys.stderr.write("Failed: `svn switch' left conflicts in the working copy. (See option --conflict.)")
         sys.exit(2)
+    elif policy == "skip":
+        print("Skipped: conflicts are left in the working copy, to be resolved via `svn resolve'.")
+        return
 
-    print("Success to update/switch the working tree.")
+    print("1: resolved the conflicts (via `svn resolve'), pls continue\n2: quit")
+    while True:
+        choice = common.ask("? ")
+        if choice == '2':
+            sys.exit(2)
+        elif choice == '1':
+            break
         
 
+def parse_info_xml(out):
+    """Parse output of `svn info --xml'. Return a list of dicts of each entry:
+    'path', 'url', 'revision', 'root' (of the repository), 'changed' (the
+    last changed revision) and 'depth' (of a working copy)."""
+
+    entries = []
+    try:
+        for (event, element) in ElementTree.iterparse(io.BytesIO(out.encode('utf-8'))):
+            if element.tag == "entry":
+                commit = element.find("commit")
+                entries.append({'path': element.get("path", ""), 'url': element.findtext("url", ""), \
+                    'revision': element.get("revision", ""), 'root': element.findtext("repository/root", ""), \
+                    'changed': commit.get("revision", "") if commit != None else "", \
+                    'depth': element.findtext("wc-info/depth", "")})
+                element.clear()
+    except ElementTree.ParseError:
+        pass #partial output of a failed command
+    return entries
+
+def read_wc_db(root):
+    """Get the entry (see parse_info_xml()) of working copy `root' from its
+    .svn/wc.db via sqlite3, without starting svn, if CMG configuration
+    `svnwcdb' is True. Return None if it's not sure, such as the format is
+    unknown, or the url would need escaping, so that svn is asked instead."""
+
+    path = os.path.join(root, ".svn", "wc.db")
+    if not common.cfgs['svnwcdb'] or sqlite3 == None or not os.path.isfile(path):
+        return None
+
+    try:
+        db = sqlite3.connect(pathlib.Path(os.path.abspath(path)).as_uri() + "?mode=ro", uri=True)
+        try:
+            if db.execute("PRAGMA user_version").fetchone()[0] not in WC_DB_FORMATS:
+                return None
+            rows = db.execute("SELECT repository.root, nodes.repos_path, nodes.revision, nodes.changed_revision, " \
+                "nodes.depth " \
+                "FROM nodes JOIN repository ON nodes.repos_id = repository.id " \
+                "WHERE nodes.local_relpath = '' AND nodes.op_depth = 0 AND nodes.presence = 'normal'").fetchall()
+        finally:
+            db.close()
+    except sqlite3.Error:
+        return None
+
+    if len(rows) != 1 or rows[0][2] == None or re.search(r"[^A-Za-z0-9/._~-]", rows[0][1] or ""):
+        return None
+    (repository, repos_path, revision, changed, depth) = rows[0]
+    url = repository
+    if repos_path:
+        url = repository + "/" + repos_path
+    return {'path': ".", 'url': url, 'revision': str(revision), 'root': repository, \
+        'changed': str(changed) if changed != None else "", 'depth': depth or "infinity"}
+
+def get_entry(root, url):
+    """Get the entry (see parse_info_xml()) of a working copy, or of a remote
+    url if given."""
+
+    entry = _infos.pop((root, url), None)
+    if entry != None:
+        return entry
+
+    if url == "":
+        entry = read_wc_db(root)
+        if entry != None:
+            return entry
+
+    cmd = ["svn", "info", "--xml"]
+    if url != "":
+        cmd = cmd + [url]
+    (out, err, code) = common.command(cmd, root)
+    entries = parse_info_xml(out)
+    if err or code != 0 or len(entries) != 1:
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+        sys.exit(2)
+
+    return entries[0]
+
 def get_info(root, url):
     """Find out current url and revision of a working copy or remote url
     
     inputs: url is optional
     outputs: the current url and current revision
     """
-    cmd = "svn info " + url
-    (out, err, code) = common.command(cmd, root)
-    if err or code != 0:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
 
-    current_url = current_revision = ""
-    for line in out.splitlines():
-        match = re.match(r"URL: (\S+)", line)
-        if match != None:
-            current_url = match.group(1)
-        match = re.match(r"Revision: (\S+)", line)
-        if match != None:
-            current_revision = match.group(1)
+    entry = get_entry(root, url)
+    return (entry['url'], entry['revision'])
 
-    return (current_url, current_revision)
+def load_tips(container):
+    """Load what get_youngests() and get_changed() found out within CMG
+    configuration `svntipttl' seconds, from file .git/cmg_svn_tips of the
+    container. Call it with _tips_lock held."""
 
+    global _tips
+    if _tips != None:
+        return
+    _tips = {}
+    if common.cfgs['svntipttl'] <= 0:
+        return
+    try:
+        with open(os.path.join(container, ".git", "cmg_svn_tips"), 'r') as f:
+            tips = json.load(f)
+        for (repository, tip) in tips.items():
+            if time.time() - tip['time'] < common.cfgs['svntipttl']:
+                _tips[repository] = tip
+    except:
+        pass #just ask the server again
 
-def add(root):    
-    cmd = "svn status"
-    (out, err, code) = common.command(cmd, root)
-    if err or code != 0:
-        sys.stderr.write("Failed: " + cmd + "\n" + err)
-        sys.exit(2)
+def save_tips(container):
+    """Keep what's found out for next commands within CMG configuration
+    `svntipttl' seconds. Call it with _tips_lock held."""
+
+    if common.cfgs['svntipttl'] <= 0:
+        return
+    try:
+        with open(os.path.join(container, ".git", "cmg_svn_tips"), 'w') as f:
+            json.dump(_tips, f, indent=1, sort_keys=True)
+    except:
+        pass #just ask the server again next time
+
+def get_youngests(container, repositories, b_partial=False):
+    """Get a dict of the youngest revision of each of `repositories' (urls of
+    repository roots), via one `svn info --xml' for those not known yet in this
+    run (or within `svntipttl' seconds, see load_tips()). If `b_partial' is
+    True, a repository which can not be reached is left out of the dict,
+    instead of failing."""
+
+    with _tips_lock:
+        load_tips(container)
+        unknown = [repository for repository in repositories if repository not in _tips]
+        if len(unknown) != 0:
+            cmd = ["svn", "info", "--xml"] + unknown
+            (out, err, code) = common.command(cmd, container)
+            for entry in parse_info_xml(out):
+                if entry['root'] in unknown and entry['revision'] != "":
+                    _tips[entry['root']] = {'youngest': entry['revision'], 'time': time.time(), 'changed': {}}
+            for repository in unknown:
+                if repository not in _tips and not b_partial:
+                    sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+                    sys.exit(2)
+            save_tips(container)
+        return dict([(repository, _tips[repository]['youngest']) for repository in repositories \
+            if repository in _tips])
+
+def get_changed(container, urls, b_partial=False):
+    """Get a dict of the last changed revision of each of `urls' (a dict of
+    the url of a branch/tag to the url of its repository root, whose youngest
+    revision is known via get_youngests()), via one `svn info --xml' for
+    those not known yet. It's kept as long as the youngest revision is. If
+    `b_partial' is True, a url which can not be reached (such as a deleted
+    branch) is left out of the dict, instead of failing."""
+
+    with _tips_lock:
+        unknown = [url for url in urls if url not in _tips[urls[url]]['changed']]
+        if len(unknown) != 0:
+            cmd = ["svn", "info", "--xml"] + unknown
+            (out, err, code) = common.command(cmd, container)
+            for entry in parse_info_xml(out):
+                if entry['url'] in unknown and entry['changed'] != "":
+                    _tips[urls[entry['url']]]['changed'][entry['url']] = entry['changed']
+            for url in unknown:
+                if url not in _tips[urls[url]]['changed'] and not b_partial:
+                    sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
+                    sys.exit(2)
+            save_tips(container)
+        return dict([(url, _tips[urls[url]]['changed'][url]) for url in urls \
+            if url in _tips[urls[url]]['changed']])
+
+def get_tip(container, entry, url):
+    """Get the last revision which changed branch/tag `url', if it's newer than
+    the working copy of `entry' (see get_entry()). Return "" if not.
+
+    The youngest revision of the repository is asked first, which is shared by
+    all components in the repository. Only if it's newer than the working copy
+    is the last changed revision of `url' asked.
+    """
+
+    youngest = get_youngests(container, [entry['root']])[entry['root']]
+    if int(youngest) <= int(entry['revision']):
+        return ""
+    changed = get_changed(container, {url: entry['root']})[url]
+    if int(changed) <= int(entry['revision']):
+        return ""
+    return changed
+
+def drop_tip(container, repository):
+    """Forget the youngest revision of `repository', as CMG commits to it."""
 
-    new_files = []
-    for line in out.splitlines():
-        pattern = r"\?\s+(\S+)"
-        match = re.match(pattern, line)
-        if match != None:
-            new_files.append(match.group(1))
+    with _tips_lock:
+        load_tips(container)
+        if _tips.pop(repository, None) != None:
+            save_tips(container)
 
-    for new_file in new_files:
-        cmd = "svn add " + new_file
+def get_owner(path, components):
+    """Get which of `components' (paths relative to container) `path' lies
+    in. Return "" if none."""
+
+    path = os.path.normpath(path)
+    owner = ""
+    for component in components:
+        component = os.path.normpath(component)
+        if (path == component or path.startswith(component + os.sep)) and len(component) > len(owner):
+            owner = component
+    return owner
+
+def prepare_status(root, config, components):
+    """Find out in advance what status() asks for `components', so that it's
+    one `svn info --xml' for all working copies, one `svn status --xml' for
+    all working copies, and for the tips of branches/tags to follow, one
+    `svn info --xml' for all repositories and at most one for all
+    branches/tags, instead of 3 commands for each component (see get_tip()).
+    Each working copy's result is used once, by get_entry() or get_changes().
+    A component left out (such as when the command fails for another
+    component, or its server can not be reached) is just asked for on its
+    own later, so that it fails on its own."""
+
+    paths = [component for component in components if os.path.isdir(os.path.join(root, component, ".svn"))]
+    if len(paths) == 0:
+        return
+
+    urls = {} #components to follow the tip of each branch/tag
+    for component in paths:
+        if config.has_option(component, "branch_url") and not config.has_option(component, "revision"):
+            urls.setdefault(config.get(component, "branch_url"), []).append(component)
+        elif config.has_option(component, "tags_url") and config.has_option(component, "tag") \
+            and not config.has_option(component, "branch_url"):
+            url = config.get(component, "tags_url") + '/' + config.get(component, "tag")
+            urls.setdefault(url, []).append(component)
+
+    names = dict([(os.path.normpath(component), component) for component in paths])
+    entries = {}
+    for component in paths:
+        entry = read_wc_db(os.path.join(root, component))
+        if entry != None:
+            entries[component] = entry
+    unknown = [component for component in paths if component not in entries]
+    if len(unknown) != 0:
+        (out, err, code) = common.command(["svn", "info", "--xml"] + unknown, root)
+        for entry in parse_info_xml(out):
+            if os.path.normpath(entry['path']) in names:
+                entries[names[os.path.normpath(entry['path'])]] = entry
+    for (component, entry) in entries.items():
+        _infos[(os.path.join(root, component), "")] = entry
+
+    tips = {} #url of the repository root of each branch/tag to follow
+    for (url, components) in urls.items():
+        for component in components:
+            if component in entries and entries[component]['url'] == url and entries[component]['root'] != "":
+                tips[url] = entries[component]['root']
+    if common.cfgs['online'] and len(tips) != 0:
+        youngests = get_youngests(root, sorted(set(tips.values())), True)
+        changed = {}
+        for (url, components) in urls.items():
+            if url in tips and tips[url] in youngests and min([int(entries[component]['revision']) \
+                for component in components if component in entries]) < int(youngests[tips[url]]):
+                changed[url] = tips[url]
+        if len(changed) != 0:
+            get_changed(root, changed, True)
+
+    (out, err, code) = common.command(["svn", "status", "--xml"] + paths, root)
+    if code != 0:
+        return
+    changes = {}
+    for component in names:
+        changes[component] = []
+    for (target, change, path) in parse_status_xml(out):
+        owner = get_owner(path, names)
+        if owner != "":
+            changes[owner].append((change, os.path.relpath(path, owner)))
+    for (component, items) in changes.items():
+        _changes[os.path.join(root, names[component])] = items
+
+def drop_cache(root):
+    """Drop what's found out in advance for a working copy, as CMG is to change it."""
+
+    for key in [key for key in _infos if key[0] == root]:
+        _infos.pop(key, None)
+    _changes.pop(root, None)
+
+
+def find_unchanged(root, config_ref, components):
+    """Find out which of `components' are still on their tag or revision in
+    baseline `config_ref', via one `svn info' for all of them (or via
+    read_wc_db()), which reads working copies only, or via marker of an
+    exported component. A component is regarded as changed if it's unknown."""
+
+    paths = [component for component in components if os.path.isdir(os.path.join(root, component, ".svn"))]
+    infos = {}
+    for component in components:
+        exported = read_export(os.path.join(root, component))
+        if component not in paths and exported != None:
+            infos[os.path.normpath(component)] = exported
+    if len(paths) + len(infos) == 0:
+        return []
+
+    for component in paths:
+        entry = read_wc_db(os.path.join(root, component))
+        if entry != None:
+            infos[os.path.normpath(component)] = (entry['url'], entry['revision'])
+    unknown = [component for component in paths if os.path.normpath(component) not in infos]
+    if len(unknown) != 0:
+        cmd = ["svn", "info", "--xml"] + unknown
+        (out, err, code) = common.command(cmd, root) #a bad working copy is just regarded as changed
+        for entry in parse_info_xml(out):
+            infos[os.path.normpath(entry['path'])] = (entry['url'], entry['revision'])
+
+    unchanged = []
+    for component in components:
+        (url, revision) = infos.get(os.path.normpath(component), ("", ""))
+        if url == "" or revision == "":
+            continue
+        if config_ref.has_option(component, "branch_url") and config_ref.has_option(component, "revision"):
+            if url == config_ref.get(component, "branch_url") and revision == config_ref.get(component, "revision"):
+                unchanged.append(component)
+        elif config_ref.has_option(component, "tags_url") and config_ref.has_option(component, "tag"):
+            if url == config_ref.get(component, "tags_url") + "/" + config_ref.get(component, "tag"):
+                unchanged.append(component)
+    return unchanged
+
+def add(root):
+    """Add new files to version control, via one `svn add' for every 100 files."""
+
+    drop_cache(root)
+    new_files = [path for (change, path) in get_changes(root) if change == "unversioned"]
+
+    for i in range(0, len(new_files), 100):
+        cmd = ["svn", "add", "--"] + new_files[i:i+100]
         (out, err, code) = common.command(cmd, root)
         if err or code != 0:
-            sys.stderr.write("Failed: " + cmd + "\n" + err)
+            sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
             sys.exit(2)
     
 def commit(root):
     """commit local modifications to remote remository"""
    
-    cmd = "svn commit"
+    drop_cache(root)
+    cmd = ["svn", "commit"]
     code = common.command_free(cmd, root)
     if code != 0:
-        sys.stderr.write("Failed: " + cmd)
+        sys.stderr.write("Failed: " + common.cmdline(cmd))
         sys.exit(2)
 
-def create_tag_core(root, url_from, revision_from, url_to):
-    """core function of create tag"""
+def create_tag_core(root, url_from, revision_from, url_to, message=""):
+    """core function of create tag. The log message is asked via editor,
+    unless `message' is given."""
     
-    cmd = "svn copy " + url_from + "@" + revision_from + " " + url_to
-    code = common.command_free(cmd, root)
+    cmd = ["svn", "copy", url_from + "@" + revision_from, url_to]
+    if message == "":
+        code = common.command_free(cmd, root)
+        err = ""
+    else:
+        cmd = cmd + ["-m", message]
+        (out, err, code) = common.command(cmd, root)
     if code != 0:
-        sys.stderr.write("Failed: " + cmd)
+        sys.stderr.write("Failed: " + common.cmdline(cmd) + "\n" + err)
         sys.exit(2)
+
+    print("Created new tag '" + url_to + "'.")
         
-def create_tag(root, component, config_now, url_now, revision_now, tags_url_ref, baseline):
-    """create tag or record revision"""
+def create_tag(root, component, config_now, url_now, revision_now, tags_url_ref, baseline, new_tags):
+    """record tag to create, or revision.
+    
+    What to do is asked, unless CMG configuration `freezepoint' says (see
+    get_policy() in common.py). As there is no easy way to find tags of a
+    revision in SVN, 'tag' is the same as 'baseline-tag'. A new tag is not
+    created here but appended to list `new_tags', as (tag, function,
+    arguments) to create it.
+    """
 
-    print("1: use revision for this component: " + revision_now)
-    print("2: create a new tag for this component.")
-    print("3: create a new tag with baseline name '" + baseline + "'.")
+    answer = {'revision': '1', 'tag': '3', 'baseline-tag': '3'}.get(common.get_policy('freezepoint'), "")
+    message = ""
+    if answer != "":
+        message = "Create tag for baseline '" + baseline + "'."
+    if answer == "":
+        print("1: use revision for this component: " + revision_now)
+        print("2: create a new tag for this component.")
+        print("3: create a new tag with baseline name '" + baseline + "'.")
     while True:
-        choice = input("? ")
+        choice = answer or common.ask("? ")
         if choice == '1':
             config_now.set(component, "branch_url", url_now)
             config_now.set(component, "revision", revision_now)
@@ -139,16 +725,17 @@ def create_tag(root, component, config_now, url_now, revision_now, tags_url_ref,
         elif choice == '2':
             new_tag = ""
             while True:
-                new_tag = input("New tag name: ")
+                new_tag = common.ask("New tag name: ")
                 if new_tag.strip() != "":
                     break
             if tags_url_ref == "":
                 print("Current branch's URL: " + url_now)
                 while True:
-                    tags_url_ref = input("Tags directory's URL: ")
+                    tags_url_ref = common.ask("Tags directory's URL: ")
                     if tags_url_ref.strip() != "":
                         break
-            create_tag_core(root, url_now, revision_now, tags_url_ref + "/" + new_tag)
+            new_tags.append((new_tag, create_tag_core, \
+                (root, url_now, revision_now, tags_url_ref + "/" + new_tag, message)))
             config_now.set(component, "tags_url", tags_url_ref)
             config_now.set(component, "tag", new_tag)
             if config_now.has_option(component, "branch_url"):
@@ -160,10 +747,11 @@ def create_tag(root, component, config_now, url_now, revision_now, tags_url_ref,
             if tags_url_ref == "":
                 print("Current branch's URL: " + url_now)
                 while True:
-                    tags_url_ref = input("Tags directory's URL: ")
+                    tags_url_ref = common.ask("Tags directory's URL: ")
                     if tags_url_ref.strip() != "":
                         break
-            create_tag_core(root, url_now, revision_now, tags_url_ref + "/" + baseline)
+            new_tags.append((baseline, create_tag_core, \
+                (root, url_now, revision_now, tags_url_ref + "/" + baseline, message)))
             config_now.set(component, "tags_url", tags_url_ref)
             config_now.set(component, "tag", baseline)
             if config_now.has_option(component, "branch_url"):
@@ -173,6 +761,16 @@ def create_tag(root, component, config_now, url_now, revision_now, tags_url_ref,
             return
         
         
+def get_host_url(config, component):
+    """Get the url of the server of a component, whose slot download() holds
+    (see get_host_slot() in common.py), as it's fetched and updated in one go."""
+
+    if config.has_option(component, "branch_url"):
+        return config.get(component, "branch_url")
+    elif config.has_option(component, "tags_url"):
+        return config.get(component, "tags_url")
+    return ""
+
 #
 # below are commands called from commands.py for each component.
 #
@@ -201,8 +799,42 @@ def download(root, config, component):
         sys.stderr.write("Neither 'branch_url' option nor 'tags_url' & 'tag' options exists in '" + component + "' section.")
         sys.exit(2)
 
+    (depth, includes) = get_sparse_options(config, component)
+    exported = None
+    if not os.path.isdir(os.path.join(root, ".svn")):
+        exported = read_export(root)
+    nested = [other for other in config.sections() if common.get_parents(other, [component])]
+
+    if is_export(config, component):
+        if len(includes) != 0:
+            sys.stderr.write("Failed: bad format of stream/baseline config: ")
+            sys.stderr.write("'include' option doesn't work with 'export' option in '" + component + "' section.")
+            sys.exit(2)
+        if exported != None and exported[0] == url and revision in ("", exported[1]):
+            print("Already exported from '" + url + "' at revision " + exported[1] + ".")
+            return
+        if exported != None and len(nested) != 0:
+            sys.stderr.write("Failed: can not export '" + root + "' again, as component(s) " + \
+                ", ".join(nested) + " lie in it, which would be removed with it.")
+            sys.exit(2)
+        if exported != None or not os.path.exists(root) or len(os.listdir(root)) == 0:
+            export(root, url, revision, depth)
+            return
+        if not os.path.isdir(os.path.join(root, ".svn")):
+            sys.stderr.write("Failed: '" + root + "' is neither a working copy nor an exported component.")
+            sys.exit(2)
+        print("Warning: this SVN component is expected to be exported, but it's a working copy. " + \
+            "Remove it to export.")
+    elif exported != None:
+        if len(nested) != 0:
+            sys.stderr.write("Failed: can not replace exported '" + root + "' with a working copy, as component(s) " + \
+                ", ".join(nested) + " lie in it, which would be removed with it.")
+            sys.exit(2)
+        print("Remove the exported component to check out a working copy.")
+        remove_export(root)
+
     if not os.path.isdir(os.path.join(root, ".svn")):
-        init(root, url, revision)
+        init(root, url, revision, depth, includes)
         return
 
     b_dirty = get_status(root)
@@ -212,35 +844,25 @@ def download(root, config, component):
             tag = config.get(component, "tag")
             print("Warning: this SVN component is expected to be on tag '" + tag + \
                 "', but the working copy contain modification(s).")
-            print("1: handled clean up manually, pls continue\n2: quit")
-            while True:
-                choice = input("? ")
-                if choice == '2':
-                    sys.exit(2)
-                elif choice == '1':
-                    break
+            handle_dirty(root)
         
         if config.has_option(component, "revision"):
             revision = config.get(component, "revision")
             print("Warning: this SVN component is expected to be on revision '" + revision + \
                 "' exactly, but the working copy contain modification(s).")
-            print("1: handled clean up manually, pls continue\n2: quit")
-            while True:
-                choice = input("? ")
-                if choice == '2':
-                    sys.exit(2)
-                elif choice == '1':
-                    break
+            handle_dirty(root)
     
-    switch(root, url, revision)
+    switch(root, url, revision, depth, includes)
     
 def status(root, config, component):
     """Show status of a component.
     
     `root' is the root of container. `config' stores the stream/baseline config.
-    `component' is the name of the component.
+    `component' is the name of the component. Return a list of what found out:
+    'off-branch', 'dirty' and/or 'behind'.
     """
 
+    container = root
     root = os.path.join(root, component) #now it's the root of this component.
     print("---- " + root)
 
@@ -258,30 +880,73 @@ def status(root, config, component):
             " options exists in '" + component + "' section.")
         sys.exit(2)
 
+    state = []
+    b_export = is_export(config, component)
     if not os.path.isdir(os.path.join(root, ".svn")):
-        sys.stderr.write("Failed: This component does not exist yet.")
-        sys.exit(2)
-        
-    (current_url, current_revision) = get_info(root, "")
+        exported = read_export(root)
+        if exported == None:
+            sys.stderr.write("Failed: This component does not exist yet.")
+            sys.exit(2)
+
+        (current_url, current_revision) = exported
+        if not b_export:
+            print("Warning: It's expected to be a working copy, but now it's exported.")
+            state.append("off-branch")
+        if (os.name == 'nt' and current_url.lower() != url.lower()) or \
+           (os.name != 'nt' and current_url != url):
+            print("Warning: It's expected to be exported from '" + url + "', but now it's from '" \
+                + current_url + "'.")
+            if "off-branch" not in state:
+                state.append("off-branch")
+        elif revision != "" and revision != current_revision:
+            print("Warning: It's expected to be exported at revision '" + revision \
+                + "', but now it's at '" + current_revision + "'.")
+            if "off-branch" not in state:
+                state.append("off-branch")
+        return state
+
+    if b_export:
+        print("Warning: It's expected to be exported, but now it's a working copy.")
+        state.append("off-branch")
+    entry = get_entry(root, "")
+    (current_url, current_revision) = (entry['url'], entry['revision'])
     
     if (os.name == 'nt' and current_url.lower() != url.lower()) or \
        (os.name != 'nt' and current_url != url):
         print("Warning: It's expected to follow '" + url + "', but now it's on '" \
             + current_url + "'.")
+        if "off-branch" not in state:
+            state.append("off-branch")
     elif revision != "":
         if revision != current_revision:
             print("Warning: It's expected to be on revision '" + revision \
                 + "', but now it's on '" + current_revision + "'.")
-    else:
-        (nouse, tip_revision) = get_info(root, url)
-        if current_revision != tip_revision:
+            if "off-branch" not in state:
+                state.append("off-branch")
+    elif common.cfgs['online']:
+        tip_revision = get_tip(container, entry, url)
+        if tip_revision != "":
             print("Warning: It's expected to be on tip revision " + tip_revision + \
                 " of branch '" + url + "', but now it's on revision " + current_revision + ".")
+            state.append("behind")
+
+    (depth, includes) = get_sparse_options(config, component)
+    if depth != "" and entry.get('depth', depth) not in (depth, ""):
+        print("Warning: It's expected to be a working copy of depth " + depth + ", but now it's " \
+            + entry['depth'] + ".")
+        if "off-branch" not in state:
+            state.append("off-branch")
+    missing = [path for path in includes if not os.path.exists(os.path.join(root, path))]
+    if len(missing) != 0:
+        print("Warning: It's expected to include " + ", ".join(missing) + ", but they are not in working copy.")
+        if "off-branch" not in state:
+            state.append("off-branch")
 
     b_dirty = get_status(root)
     
     if not b_dirty:
-        return
+        return state
+    state.append("dirty")
 
     if config.has_option(component, "tag"):
         tag = config.get(component, "tag")
@@ -293,6 +958,8 @@ def status(root, config, component):
         print("Warning: this SVN component is expected to be on revision " + revision + \
             " exactly, but the working copy contain modification(s).")
 
+    return state
+
 
 def upload(root, config, component):
     """Upload/deliver a component's local modification in working copy to its (remote) repository.
@@ -301,10 +968,14 @@ def upload(root, config, component):
     `component' is the name of the component.
     """
     
+    container = root
     root = os.path.join(root, component) #now it's the root of this component.
     print("---- " + root)
 
     if not os.path.isdir(os.path.join(root, ".svn")):
+        if read_export(root) != None:
+            print("Nothing to upload, as this SVN component is exported.")
+            return
         sys.stderr.write("Failed: This component does not exist yet.")
         sys.exit(2)
     
@@ -317,25 +988,15 @@ def upload(root, config, component):
         tag = config.get(component, "tag")
         print("Warning: this SVN component is expected to be on tag '" + tag + \
             "', so that local modifications will not be uploaded.")
-        print("1: handled clean up manually, pls continue\n2: quit")
-        while True:
-            choice = input("? ")
-            if choice == '2':
-                sys.exit(2)
-            elif choice == '1':
-                return
+        handle_dirty(root)
+        return
 
     if config.has_option(component, "revision"):
         revision = config.get(component, "revision")
         print("Warning: this SVN component is expected to be on given revision " + \
             revision + ", so that local modificaitons will not be uploaded.")
-        print("1: handled clean up manually, pls continue\n2: quit")
-        while True:
-            choice = input("? ")
-            if choice == '2':
-                sys.exit(2)
-            elif choice == '1':
-                return
+        handle_dirty(root)
+        return
 
     if not config.has_option(component, "branch_url"):
         sys.stderr.write("Failed: bad format of stream/baseline config: ")
@@ -345,7 +1006,8 @@ def upload(root, config, component):
     
     url = config.get(component, "branch_url")
     
-    (current_url, current_revision) = get_info(root, "")
+    entry = get_entry(root, "")
+    (current_url, current_revision) = (entry['url'], entry['revision'])
     
     if (os.name == 'nt' and current_url.lower() != url.lower()) or \
        (os.name != 'nt' and current_url != url):
@@ -353,8 +1015,8 @@ def upload(root, config, component):
             + current_url + "'.")
         sys.exit(2)
             
-    (nouse, tip_revision) = get_info(root, url)
-    if current_revision != tip_revision:
+    tip_revision = get_tip(container, entry, url)
+    if tip_revision != "":
         print("Tip revision of branch '" + url + "' is " + tip_revision \
             + ", but now it's on revision " + current_revision + ".")
         switch(root, url, "")
@@ -363,35 +1025,37 @@ def upload(root, config, component):
         add(root)
 
     commit(root)
+    drop_tip(container, entry['root'])
 
     
-def freeze(root, config_now, config_ref, component, baseline):
-    """Find out tag (create tag if neccessary) or revision for a component."""
+def freeze(root, config_now, config_ref, component, baseline, new_tags):
+    """Find out tag or revision for a component. Tags to create are appended
+    to list `new_tags', see create_tag()."""
 
     root = os.path.join(root, component) #now it's the root of this component.
     print("---- " + root)
     
+    exported = None
     if not os.path.isdir(os.path.join(root, ".svn")):
-        sys.stderr.write("Failed: This component does not exist yet.")
-        sys.exit(2)
+        exported = read_export(root)
+        if exported == None:
+            sys.stderr.write("Failed: This component does not exist yet.")
+            sys.exit(2)
 
-    b_dirty = get_status(root)
-    
-    if b_dirty:
-        print("Warning: this SVN component's working copy contain modification(s).")
-        print("1: handled clean up manually, pls continue\n2: quit")
-        while True:
-            choice = input("? ")
-            if choice == '2':
-                sys.exit(2)
-            elif choice == '1':
-                break
+    if exported != None:
+        (url_now, revision_now) = exported
+    else:
+        b_dirty = get_status(root)
+        
+        if b_dirty:
+            print("Warning: this SVN component's working copy contain modification(s).")
+            handle_dirty(root)
 
-    if not os.path.isdir(os.path.join(root, ".svn")):
-        sys.stderr.write("Failed: This component does not exist yet.")
-        sys.exit(2)
+        if not os.path.isdir(os.path.join(root, ".svn")):
+            sys.stderr.write("Failed: This component does not exist yet.")
+            sys.exit(2)
 
-    (url_now, revision_now) = get_info(root, "")
+        (url_now, revision_now) = get_info(root, "")
                 
     if config_ref.has_option(component, "branch_url") and config_ref.has_option(component, "revision"):
         url_ref = config_ref.get(component, "branch_url")
@@ -429,10 +1093,10 @@ def freeze(root, config_now, config_ref, component, baseline):
             if config_now.has_option(component, "revision"):
                 config_now.remove_option(component, "revision")
         else:
-            create_tag(root, component, config_now, url_now, revision_now, tags_url_ref, baseline)
+            create_tag(root, component, config_now, url_now, revision_now, tags_url_ref, baseline, new_tags)
 
     elif config_ref.has_option(component, "tags_url"):
         tags_url_ref = config_ref.get(component, "tags_url")
-        create_tag(root, component, config_now, url_now, revision_now, tags_url_ref, baseline)
+        create_tag(root, component, config_now, url_now, revision_now, tags_url_ref, baseline, new_tags)
     else:
-        create_tag(root, component, config_now, url_now, revision_now, "", baseline)
+        create_tag(root, component, config_now, url_now, revision_now, "", baseline, new_tags)
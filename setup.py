@@ -14,6 +14,6 @@ setup(name = 'CMGlue',
     license = '(TBD)',
     long_description = 'CMGlue (Configuration Management Glue) is a better git-submodule, to manage a workspace which may contains multiple components that may from various version control tools such as Git and SVN (Subversion), or even just from a shared folder.',
     packages=['cmglib'],
-    scripts=['cmg', 'cmg.bat', 'cmg_create_demo', 'cmg_create_demo.bat'],
+    scripts=['cmg', 'cmg.bat', 'cmg_create_demo', 'cmg_create_demo.bat', 'cmg_benchmark', 'cmg_benchmark.bat'],
     data_files=[('Doc', ['cmg_manual.txt', 'cmg_manual.html'])]
     )
@@ -0,0 +1,136 @@
+"""Check processes each CMG command starts for each component against BUDGETS
+of cmg_benchmark, run via `python -m unittest'.
+
+Commands run in this process on a small generated workspace, with
+common.run_command() and common.command_pipe() wrapped to record every git/svn
+command and the component it's for.
+"""
+
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import contextlib
+import importlib.util
+import importlib.machinery
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from cmglib import common
+from cmglib import commands
+from cmglib import git
+from cmglib import svn
+
+def load_benchmark():
+    """Import script cmg_benchmark, which has no .py suffix."""
+
+    loader = importlib.machinery.SourceFileLoader("cmg_benchmark", os.path.join(ROOT, "cmg_benchmark"))
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(module)
+    return module
+
+benchmark = load_benchmark()
+
+
+class Recorder:
+    """Record commands per component, in the format of count_processes() of
+    cmg_benchmark: {component: {'tool subcommand': count}}."""
+
+    def __init__(self):
+        self.components = {}
+        self.run_command = common.run_command
+        self.command_pipe = common.command_pipe
+
+    def record(self, component, cmd):
+        name = " ".join(cmd[:2]) if isinstance(cmd, list) else " ".join(cmd.split()[:2])
+        counts = self.components.setdefault(component, {})
+        counts[name] = counts.get(name, 0) + 1
+
+    @contextlib.contextmanager
+    def patched(self):
+        """Record commands within a `with' statement."""
+
+        def run_command(cmd, dir, timeout=None, env=None, b_capture=True, component="."):
+            self.record(component, cmd)
+            return self.run_command(cmd, dir, timeout, env, b_capture, component)
+        def command_pipe(cmd, dir):
+            self.record(common.get_component(), cmd)
+            return self.command_pipe(cmd, dir)
+        with mock.patch.object(common, 'run_command', run_command), \
+            mock.patch.object(common, 'command_pipe', command_pipe):
+            yield
+
+
+class BudgetTest(unittest.TestCase):
+
+    params = {'git': 2, 'svn': 0, 'dir': 1, 'commits': 3, 'files': 3, 'filesize': 64}
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="cmg_test_")
+        env = {'GIT_AUTHOR_NAME': "cmg", 'GIT_AUTHOR_EMAIL': "cmg@example.com", \
+            'GIT_COMMITTER_NAME': "cmg", 'GIT_COMMITTER_EMAIL': "cmg@example.com", \
+            'GIT_CONFIG_NOSYSTEM': "1", 'GIT_CONFIG_GLOBAL': os.devnull, 'LC_ALL': "C"}
+        self.env = mock.patch.dict(os.environ, env)
+        self.env.start()
+        self.cfgs = dict(common.cfgs)
+        self.cwd = os.getcwd()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.workspace = benchmark.create_workspace(self.workdir, self.params, dict(os.environ))
+        os.chdir(self.workspace)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.reset()
+        self.env.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def reset(self):
+        """Forget what the last command kept in this process, as if CMG starts again."""
+
+        common.cfgs.clear()
+        common.cfgs.update(self.cfgs)
+        git.close_readers()
+        git._refs.clear()
+        git._mirrors.clear()
+        svn._infos.clear()
+        svn._changes.clear()
+        svn._tips = None
+
+    def run_cmg(self, name, command, args):
+        """Run a CMG command, and check the processes it starts for each
+        component against BUDGETS[type][name]."""
+
+        self.reset()
+        recorder = Recorder()
+        output = io.StringIO()
+        try:
+            with recorder.patched(), contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                command(args)
+        except SystemExit as err:
+            if err.code not in (None, 0):
+                self.fail("cmg " + name + " exits with " + str(err.code) + ":\n" + output.getvalue())
+
+        self.assertIn(".", recorder.components, "no command is recorded for the container")
+        messages = benchmark.check_budgets(name, recorder.components, self.params)
+        self.assertEqual(messages, [], "\n".join(messages))
+
+    def test_budgets(self):
+        jobs = ["-j", "2", "--non-interactive"]
+        self.run_cmg("download_cold", commands.download, jobs)
+        self.run_cmg("download_warm", commands.download, jobs)
+        self.run_cmg("status", commands.status, jobs)
+        self.run_cmg("upload", commands.upload, ["--non-interactive"])
+        self.run_cmg("freeze", commands.freeze, jobs + ["--freeze-point=revision", "test_bl1"])
+
+
+@unittest.skipUnless(shutil.which('svn') and shutil.which('svnadmin'), "svn is not installed")
+class SvnBudgetTest(BudgetTest):
+
+    params = {'git': 1, 'svn': 2, 'dir': 0, 'commits': 3, 'files': 3, 'filesize': 64}
+
+
+if __name__ == '__main__':
+    unittest.main()
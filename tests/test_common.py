@@ -0,0 +1,47 @@
+"""Tests of running components in parallel, run via `python -m unittest'."""
+
+import os
+import sys
+import time
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cmglib import common
+
+
+class HostSlotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cfgs = dict(common.cfgs)
+        common.cfgs.update({'hostjobs': 1, 'interactive': True})
+
+    def tearDown(self):
+        common.cfgs.clear()
+        common.cfgs.update(self.cfgs)
+
+    def test_ask_with_host_slot(self):
+        """A question asked while holding the only slot of a server doesn't
+        block a fetch from the same server, which the question waits for."""
+
+        answers = []
+        def apply():
+            with common.get_host_slot("https://example.com/a.git"):
+                answers.append(common.ask("? "))
+        def fetch():
+            time.sleep(0.2) #after apply() takes the slot
+            with common.get_host_slot("https://example.com/b.git"):
+                answers.append("fetched")
+
+        tasks = [("a", None, (apply, ()), []), ("b", (fetch, ()), None, [])]
+        with mock.patch('builtins.input', return_value="1"):
+            thread = threading.Thread(target=common.run_pipeline, args=(tasks, 2), daemon=True)
+            thread.start()
+            thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(answers, ["fetched", "1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
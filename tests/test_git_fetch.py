@@ -0,0 +1,73 @@
+"""Regression tests of fetching Git components, run via `python -m unittest'."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+import configparser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cmglib import common
+from cmglib import git
+
+
+def run(cmd, cwd):
+    return subprocess.run(cmd, cwd=cwd, check=True, stdout=subprocess.PIPE, \
+        stderr=subprocess.PIPE, universal_newlines=True).stdout.strip()
+
+@unittest.skipIf(shutil.which("git") == None, "git is not installed")
+class ShallowDownloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.upstream = os.path.join(self.workdir, "upstream")
+        os.makedirs(self.upstream)
+        run(["git", "init", "-q", "-b", "master"], self.upstream)
+        for number in range(3):
+            self.commit(number)
+        self.cfgs = dict(common.cfgs)
+        common.cfgs.update({'online': True, 'fetchttl': 0, 'cachedir': "", 'gitrebase': True, \
+            'interactive': False, 'dirty': "", 'conflict': ""})
+
+    def tearDown(self):
+        common.cfgs.clear()
+        common.cfgs.update(self.cfgs)
+        shutil.rmtree(self.workdir)
+
+    def commit(self, number):
+        with open(os.path.join(self.upstream, "file.txt"), 'w') as f:
+            f.write(str(number) + "\n")
+        run(["git", "add", "file.txt"], self.upstream)
+        run(["git", "-c", "user.name=cmg", "-c", "user.email=cmg@example.com", \
+            "commit", "-q", "-m", "c" + str(number)], self.upstream)
+
+    def test_download_twice_with_depth(self):
+        """A clean branch component of `depth' 1 follows new upstream commits
+        on the next download, instead of diverging from origin/master."""
+
+        config = configparser.ConfigParser()
+        config.read_dict({'comp': {'type': "git", 'url': "file://" + self.upstream, \
+            'branch': "origin/master", 'depth': "1"}})
+        root = os.path.join(self.workdir, "ws")
+        component = os.path.join(root, "comp")
+
+        git.download(root, config, 'comp')
+        self.assertTrue(os.path.isfile(os.path.join(component, ".git", "shallow")))
+        old_tip = run(["git", "rev-parse", "HEAD"], component)
+
+        self.commit(3)
+        git.download(root, config, 'comp')
+        self.commit(4)
+        git.download(root, config, 'comp')
+
+        self.assertEqual(run(["git", "rev-parse", "HEAD"], component), \
+            run(["git", "rev-parse", "HEAD"], self.upstream))
+        self.assertEqual(run(["git", "rev-parse", "origin/master"], component), \
+            run(["git", "rev-parse", "HEAD"], self.upstream))
+        run(["git", "merge-base", "--is-ancestor", old_tip, "HEAD"], component)
+
+
+if __name__ == '__main__':
+    unittest.main()